@@ -1,5 +1,6 @@
 from urllib.parse import unquote
 
+from django.conf import settings
 from django.contrib import admin
 from django.shortcuts import redirect
 from django.shortcuts import reverse
@@ -7,13 +8,17 @@ from django.templatetags.static import static
 from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 
+from .models import Banner
+from .models import GeocodeCache
+from .models import GeocodingTask
 from .models import Order
 from .models import OrderProduct
 from .models import Product
 from .models import ProductCategory
 from .models import Restaurant
 from .models import RestaurantMenuItem
-from .utils import fetch_coordinates, get_eligible_restaurants, calculate_distance
+from .candidates import get_order_candidates
+from .utils import get_coordinates
 
 
 class RestaurantMenuItemInline(admin.TabularInline):
@@ -35,6 +40,7 @@ class RestaurantAdmin(admin.ModelAdmin):
         'contact_phone',
         'latitude',
         'longitude',
+        'capacity',
     ]
     inlines = [
         RestaurantMenuItemInline,
@@ -43,9 +49,9 @@ class RestaurantAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not obj.pk:
             if not (obj.latitude and obj.longitude):
-                longitude, latitude = fetch_coordinates(obj.address)
-                obj.latitude = latitude
-                obj.longitude = longitude
+                coordinates = get_coordinates(obj.address)
+                if coordinates:
+                    obj.longitude, obj.latitude = coordinates
         super().save_model(request, obj, form, change)
 
 
@@ -122,11 +128,85 @@ class ProductAdmin(admin.ModelAdmin):
     get_image_list_preview.short_description = 'превью'
 
 
+@admin.register(Banner)
+class BannerAdmin(admin.ModelAdmin):
+    list_display = [
+        'get_image_list_preview',
+        'title',
+        'position',
+        'active_from',
+        'active_until',
+    ]
+    list_display_links = [
+        'title',
+    ]
+    list_editable = [
+        'position',
+    ]
+    fields = [
+        'title',
+        'text',
+        'image',
+        'get_image_preview',
+        'position',
+        'active_from',
+        'active_until',
+    ]
+    readonly_fields = [
+        'get_image_preview',
+    ]
+
+    def get_image_preview(self, obj):
+        if not obj.image:
+            return 'выберите картинку'
+        return format_html('<img src="{url}" style="max-height: 200px;"/>', url=obj.image.url)
+
+    get_image_preview.short_description = 'превью'
+
+    def get_image_list_preview(self, obj):
+        if not obj.image:
+            return 'нет картинки'
+        return format_html('<img src="{src}" style="max-height: 50px;"/>', src=obj.image.url)
+
+    get_image_list_preview.short_description = 'превью'
+
+
 @admin.register(ProductCategory)
 class ProductAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(GeocodeCache)
+class GeocodeCacheAdmin(admin.ModelAdmin):
+    list_display = [
+        'address',
+        'latitude',
+        'longitude',
+        'fetched_at',
+    ]
+    search_fields = [
+        'address',
+    ]
+
+
+@admin.register(GeocodingTask)
+class GeocodingTaskAdmin(admin.ModelAdmin):
+    list_display = [
+        'order',
+        'status',
+        'attempts',
+        'created_at',
+        'processed_at',
+        'next_attempt_at',
+    ]
+    list_filter = [
+        'status',
+    ]
+    raw_id_fields = [
+        'order',
+    ]
+
+
 class OrderProductInline(admin.TabularInline):
     model = OrderProduct
     extra = 1
@@ -141,7 +221,7 @@ class OrderAdmin(admin.ModelAdmin):
         'id',
         'status',
         'payment_method',
-        'total_cost_annotation',
+        'total_cost',
         'order_date',
         'call_date',
         'delivery_date',
@@ -158,12 +238,14 @@ class OrderAdmin(admin.ModelAdmin):
         'phonenumber',
         'address',
     )
+    readonly_fields = (
+        'total_cost',
+    )
     change_form_template = 'admin/order_change_form.html'
 
-    def total_cost_annotation(self, obj):
-        return obj.total_cost
-
-    total_cost_annotation.short_description = 'Сумма заказа'
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_total_cost()
 
     def get_fields(self, request, obj=None):
         fields = super().get_fields(request, obj)
@@ -183,22 +265,25 @@ class OrderAdmin(admin.ModelAdmin):
         obj = self.get_object(request, unquote(object_id)) if object_id else None
 
         if obj:
-            restaurants_info = []
-
-            eligible_restaurants = get_eligible_restaurants(obj)
-            for restaurant in Restaurant.objects.all():
-                distance = None
-                if obj.latitude and obj.longitude and restaurant.latitude and restaurant.longitude:
-                    distance = calculate_distance(obj.latitude, obj.longitude, restaurant.latitude,
-                                                  restaurant.longitude)
-
-                can_prepare = restaurant in eligible_restaurants
-                restaurants_info.append({
-                    'restaurant': restaurant,
-                    'distance': distance,
-                    'can_prepare': can_prepare,
-                })
-
-            extra_context['restaurants_info'] = restaurants_info
+            candidates = get_order_candidates(obj)
+            if obj.latitude and obj.longitude:
+                # ближайшие рестораны и ближайшие из тех, что могут приготовить заказ
+                limit = settings.NEAREST_RESTAURANTS_LIMIT
+                located_candidates = [candidate for candidate in candidates if candidate.distance is not None]
+                eligible_candidates = [candidate for candidate in located_candidates if candidate.can_prepare]
+                shown_candidates = {
+                    candidate.restaurant_id: candidate
+                    for candidate in located_candidates[:limit] + eligible_candidates[:limit]
+                }
+                candidates = sorted(shown_candidates.values(), key=lambda candidate: candidate.distance)
+
+            extra_context['restaurants_info'] = [
+                {
+                    'restaurant': candidate.restaurant,
+                    'distance': candidate.distance,
+                    'can_prepare': candidate.can_prepare,
+                }
+                for candidate in candidates
+            ]
 
         return super().changeform_view(request, object_id, form_url, extra_context)
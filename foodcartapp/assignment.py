@@ -0,0 +1,136 @@
+import time
+from collections import Counter
+
+import numpy as np
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Order
+from .models import MANAGER_REVIEW, NEW, RESTAURANT_PROCESSING, UNPROCESSED_STATUSES
+from .utils import calculate_distance_matrix, get_eligible_restaurants_by_order, get_restaurants
+
+
+ASSIGNABLE_STATUSES = [NEW, MANAGER_REVIEW]
+# оставить заказ без ресторана дороже любой поездки, а неподходящий ресторан ещё дороже
+UNASSIGNED_COST = 1e6
+INELIGIBLE_COST = 1e9
+
+
+def solve_assignment(costs):
+    # венгерский алгоритм с потенциалами для прямоугольной матрицы,
+    # в которой столбцов не меньше, чем строк
+    costs = np.asarray(costs, dtype=float)
+    rows_count, columns_count = costs.shape
+    if rows_count > columns_count:
+        raise ValueError('Столбцов в матрице стоимостей должно быть не меньше, чем строк')
+
+    row_potentials = np.zeros(rows_count + 1)
+    column_potentials = np.zeros(columns_count + 1)
+    # нулевой столбец фиктивный, строки нумеруются с единицы, ноль значит «свободен»
+    row_by_column = np.zeros(columns_count + 1, dtype=int)
+    previous_column = np.zeros(columns_count + 1, dtype=int)
+
+    for row in range(1, rows_count + 1):
+        row_by_column[0] = row
+        column = 0
+        min_reduced_costs = np.full(columns_count + 1, np.inf)
+        visited = np.zeros(columns_count + 1, dtype=bool)
+        while row_by_column[column]:
+            visited[column] = True
+            current_row = row_by_column[column]
+            reduced_costs = costs[current_row - 1] - row_potentials[current_row] - column_potentials[1:]
+            not_visited = ~visited[1:]
+            improved = not_visited & (reduced_costs < min_reduced_costs[1:])
+            min_reduced_costs[1:][improved] = reduced_costs[improved]
+            previous_column[1:][improved] = column
+
+            candidates = np.where(not_visited, min_reduced_costs[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+
+            visited_columns = np.flatnonzero(visited)
+            row_potentials[row_by_column[visited_columns]] += delta
+            column_potentials[visited_columns] -= delta
+            min_reduced_costs[1:][not_visited] -= delta
+            column = next_column
+
+        while column:
+            row_by_column[column] = row_by_column[previous_column[column]]
+            column = previous_column[column]
+
+    assignment = np.full(rows_count, -1)
+    for column in np.flatnonzero(row_by_column[1:]) + 1:
+        assignment[row_by_column[column] - 1] = column - 1
+    return assignment
+
+
+def get_restaurant_loads():
+    loads = (
+        Order.objects
+        .filter(status__in=UNPROCESSED_STATUSES, assigned_restaurant__isnull=False)
+        .values('assigned_restaurant')
+        .annotate(orders_count=Count('id'))
+        .values_list('assigned_restaurant', 'orders_count')
+    )
+    return dict(loads)
+
+
+def plan_assignments(orders):
+    started_at = time.perf_counter()
+    orders = [order for order in orders if order.latitude is not None and order.longitude is not None]
+    eligible_restaurants = get_eligible_restaurants_by_order(orders)
+
+    loads = get_restaurant_loads()
+    candidates_count = Counter(
+        restaurant.id
+        for order in orders
+        for restaurant in eligible_restaurants[order.id]
+    )
+    restaurants = [
+        restaurant
+        for restaurant in get_restaurants()
+        if restaurant.id in candidates_count
+        and restaurant.latitude is not None and restaurant.longitude is not None
+    ]
+
+    # каждый ресторан раскладывается на столько мест, сколько заказов он ещё может взять
+    slots = []
+    for position, restaurant in enumerate(restaurants):
+        free_capacity = max(restaurant.capacity - loads.get(restaurant.id, 0), 0)
+        slots.extend([position] * min(free_capacity, candidates_count[restaurant.id]))
+
+    assignments = []
+    if orders and slots:
+        distances = calculate_distance_matrix(
+            [(order.latitude, order.longitude) for order in orders],
+            [(restaurant.latitude, restaurant.longitude) for restaurant in restaurants],
+        )
+        eligible = np.array([
+            [restaurant in eligible_restaurants[order.id] for restaurant in restaurants]
+            for order in orders
+        ]).reshape(len(orders), len(restaurants))
+        slot_costs = np.where(eligible, distances, INELIGIBLE_COST)[:, slots]
+        costs = np.hstack([slot_costs, np.full((len(orders), len(orders)), UNASSIGNED_COST)])
+
+        for order_position, column in enumerate(solve_assignment(costs)):
+            if column < len(slots) and slot_costs[order_position, column] < INELIGIBLE_COST:
+                restaurant_position = slots[column]
+                assignments.append((
+                    orders[order_position],
+                    restaurants[restaurant_position],
+                    float(distances[order_position, restaurant_position]),
+                ))
+
+    return assignments, time.perf_counter() - started_at
+
+
+def apply_assignments(assignments):
+    now = timezone.now()
+    orders = []
+    for order, restaurant, _ in assignments:
+        order.assigned_restaurant = restaurant
+        order.status = RESTAURANT_PROCESSING
+        # bulk_update не обновляет auto_now-поля сам
+        order.updated_at = now
+        orders.append(order)
+    Order.objects.bulk_update(orders, ['assigned_restaurant', 'status', 'updated_at'])
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from star_burger.db_router import read_from_primary
+
+
+CATALOG_NAMESPACE = 'catalog'
+MENU_NAMESPACE = 'menu'
+RESTAURANTS_NAMESPACE = 'restaurants'
+BANNERS_NAMESPACE = 'banners'
+
+_missing = object()
+
+# счётчики попаданий в кэш для текущего запроса, их заводит middleware с метриками
+request_cache_stats = ContextVar('request_cache_stats', default=None)
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def hit(self, namespace):
+        with self._lock:
+            self.hits[namespace] += 1
+        self.count_for_request('hits')
+
+    def miss(self, namespace):
+        with self._lock:
+            self.misses[namespace] += 1
+        self.count_for_request('misses')
+
+    @staticmethod
+    def count_for_request(outcome):
+        stats = request_cache_stats.get()
+        if stats is not None:
+            stats[outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            namespaces = sorted(set(self.hits) | set(self.misses))
+            return {
+                namespace: {
+                    'hits': self.hits[namespace],
+                    'misses': self.misses[namespace],
+                }
+                for namespace in namespaces
+            }
+
+
+cache_stats = CacheStats()
+
+
+def get_version_key(namespace):
+    return f'{namespace}:version'
+
+
+def get_version(namespace):
+    # версия начинается с текущего времени, чтобы после потери ключа
+    # не вернуться к номеру, под которым уже лежат устаревшие данные
+    return cache.get_or_set(get_version_key(namespace), time.time_ns, None)
+
+
+def bump_version(namespace):
+    try:
+        cache.incr(get_version_key(namespace))
+    except ValueError:
+        cache.set(get_version_key(namespace), time.time_ns(), None)
+
+
+def get_versioned_key(namespace, *parts):
+    return ':'.join(str(part) for part in (namespace, get_version(namespace), *parts))
+
+
+def get_or_set_versioned(namespace, parts, default, timeout=None):
+    cache_key = get_versioned_key(namespace, *parts)
+    value = cache.get(cache_key, _missing)
+    if value is not _missing:
+        cache_stats.hit(namespace)
+        return value
+
+    cache_stats.miss(namespace)
+    # кэш общий для всех сессий, отстающая реплика оставила бы в нём устаревшие данные до следующей смены версии
+    with read_from_primary():
+        value = default()
+    cache.set(cache_key, value, settings.CACHE_TIMEOUT if timeout is None else timeout)
+    return value
+
+
+def versioned_cache(namespace, *parts, timeout=None):
+    # результат функции кэшируется, пока не сменится версия пространства имён
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args):
+            return get_or_set_versioned(namespace, (*parts, *args), lambda: func(*args), timeout)
+        return wrapper
+    return decorator
@@ -0,0 +1,102 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import spatial, utils
+from .models import Order, OrderProduct, OrderRestaurantCandidate
+from .models import UNPROCESSED_STATUSES
+
+
+def calculate_candidates(orders):
+    # храним только то, что показывают страница заказов и админка: ближайшие рестораны
+    # и ближайшие из тех, что могут приготовить заказ. Их находит пространственный индекс,
+    # не измеряя расстояния до всех ресторанов
+    index = spatial.get_restaurant_index()
+    limit = settings.NEAREST_RESTAURANTS_LIMIT
+    eligible_restaurants = utils.get_eligible_restaurants_by_order(orders)
+
+    candidates = []
+    for order in orders:
+        eligible_ids = {restaurant.id for restaurant in eligible_restaurants.get(order.id, ())}
+        if order.latitude is None or order.longitude is None:
+            candidates.extend(
+                OrderRestaurantCandidate(order=order, restaurant=restaurant, distance=None, can_prepare=True)
+                for restaurant in eligible_restaurants.get(order.id, ())
+            )
+            continue
+
+        nearest = {
+            restaurant.id: (restaurant, distance)
+            for restaurant, distance in (
+                index.nearest(order.latitude, order.longitude, limit)
+                + index.nearest(order.latitude, order.longitude, limit, restaurant_ids=eligible_ids)
+            )
+        }
+        candidates.extend(
+            OrderRestaurantCandidate(
+                order=order,
+                restaurant=restaurant,
+                distance=distance,
+                can_prepare=restaurant.id in eligible_ids,
+            )
+            for restaurant, distance in nearest.values()
+        )
+    return candidates
+
+
+def refresh_candidates(order_ids=None, touch_orders=False):
+    # таблица хранится только для незавершённых заказов. Без order_ids пересчитываются все:
+    # после правки ресторана меняются ближайшие рестораны любого заказа
+    orders = Order.objects.filter(status__in=UNPROCESSED_STATUSES).only('id', 'latitude', 'longitude')
+    stale_candidates = OrderRestaurantCandidate.objects.all()
+    if order_ids is not None:
+        orders = orders.filter(id__in=order_ids)
+        stale_candidates = stale_candidates.filter(order__in=order_ids)
+
+    with transaction.atomic():
+        stale_candidates.delete()
+        OrderRestaurantCandidate.objects.bulk_create(calculate_candidates(list(orders)), batch_size=1000)
+        if touch_orders:
+            # заказ мог уйти на страницу менеджера ещё без ресторанов, пусть она получит его снова.
+            # Правка ресторана или меню метки не трогает, иначе переотправила бы все открытые заказы
+            orders.update(updated_at=timezone.now())
+
+
+def refresh_menu_item_candidates(product_id):
+    order_ids = list(
+        OrderProduct.objects
+        .filter(product=product_id, order__status__in=UNPROCESSED_STATUSES)
+        .values_list('order', flat=True)
+    )
+    if order_ids:
+        refresh_candidates(order_ids=order_ids)
+
+
+def attach_calculated_candidates(orders):
+    # для завершённых заказов таблица не ведётся, подходящие рестораны считаем на лету
+    if not orders:
+        return
+    eligible_candidates = defaultdict(list)
+    for candidate in calculate_candidates(orders):
+        if candidate.can_prepare and candidate.distance is not None:
+            eligible_candidates[candidate.order.id].append(candidate)
+    for order in orders:
+        order.eligible_candidates = sorted(eligible_candidates[order.id], key=lambda candidate: candidate.distance)
+
+
+def get_order_candidates(order):
+    candidates = (
+        order.restaurant_candidates
+        .select_related('restaurant')
+        .order_by(F('distance').asc(nulls_last=True), 'restaurant__name')
+    )
+    if order.status in UNPROCESSED_STATUSES:
+        return list(candidates)
+    # для завершённых заказов таблица не ведётся, считаем на лету
+    return sorted(
+        calculate_candidates([order]),
+        key=lambda candidate: (candidate.distance is None, candidate.distance or 0),
+    )
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.DEBUG or not settings.IS_LOCAL_CACHE:
+        return []
+    return [
+        Warning(
+            'Кэш хранится в памяти процесса: воркеры gunicorn не видят изменений друг друга '
+            'и до истечения CACHE_TIMEOUT отдают устаревшие каталог, меню и рестораны.',
+            hint='Укажите общий кэш в CACHE_URL, например redis://localhost:6379/1.',
+            id='foodcartapp.W001',
+        ),
+    ]
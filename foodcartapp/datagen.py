@@ -0,0 +1,114 @@
+import random
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.db import transaction
+from django.db.models import Max
+
+from .cache import BANNERS_NAMESPACE, CATALOG_NAMESPACE, MENU_NAMESPACE, RESTAURANTS_NAMESPACE, bump_version
+from .candidates import refresh_candidates
+from .models import Order, OrderProduct, Product, ProductCategory, Restaurant, RestaurantMenuItem
+from .models import UNPROCESSED_STATUSES
+
+
+# границы Москвы, в которых раскладываются рестораны и адреса заказов
+LATITUDE_RANGE = (55.55, 55.92)
+LONGITUDE_RANGE = (37.35, 37.85)
+
+
+def create_in_bulk(model, objects):
+    # SQLite не возвращает первичные ключи из bulk_create, поэтому новые строки перечитываются
+    last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    model.objects.bulk_create(objects, batch_size=1000)
+    return list(model.objects.filter(id__gt=last_id).order_by('id'))
+
+
+def generate_coordinates(rng):
+    return (
+        Decimal(f'{rng.uniform(*LATITUDE_RANGE):.6f}'),
+        Decimal(f'{rng.uniform(*LONGITUDE_RANGE):.6f}'),
+    )
+
+
+@transaction.atomic
+def generate_dataset(categories_count=10, products_count=300, restaurants_count=100, orders_count=300,
+                     max_order_lines=5, availability_rate=0.8, seed=0):
+    # данные пишутся через bulk_create, сигналы не срабатывают, поэтому
+    # кэши и таблица ресторанов-кандидатов обновляются в конце вручную
+    rng = random.Random(seed)
+
+    categories = create_in_bulk(ProductCategory, [
+        ProductCategory(name=f'Категория {number}')
+        for number in range(categories_count)
+    ])
+    products = create_in_bulk(Product, [
+        Product(
+            name=f'Товар {number}',
+            category=rng.choice(categories),
+            price=Decimal(rng.randrange(50, 1000)),
+            image=f'product_{number}.jpg',
+            special_status=rng.random() < 0.1,
+            description=f'Описание товара {number}',
+        )
+        for number in range(products_count)
+    ])
+
+    restaurants = []
+    for number in range(restaurants_count):
+        latitude, longitude = generate_coordinates(rng)
+        restaurants.append(Restaurant(
+            name=f'Ресторан {number}',
+            address=f'Москва, улица {number}',
+            contact_phone='+79260000000',
+            latitude=latitude,
+            longitude=longitude,
+        ))
+    restaurants = create_in_bulk(Restaurant, restaurants)
+
+    RestaurantMenuItem.objects.bulk_create([
+        RestaurantMenuItem(
+            restaurant=restaurant,
+            product=product,
+            availability=rng.random() < availability_rate,
+        )
+        for restaurant in restaurants
+        for product in products
+    ], batch_size=1000)
+
+    orders = []
+    order_lines = []
+    for number in range(orders_count):
+        latitude, longitude = generate_coordinates(rng)
+        lines = [
+            (product, rng.randint(1, 3))
+            for product in rng.sample(products, rng.randint(1, max_order_lines))
+        ]
+        orders.append(Order(
+            firstname='Клиент',
+            lastname=f'Номер {number}',
+            phonenumber='+79261234567',
+            address=f'Москва, проспект {number}',
+            latitude=latitude,
+            longitude=longitude,
+            status=rng.choice(UNPROCESSED_STATUSES),
+            total_cost=sum(product.price * quantity for product, quantity in lines),
+        ))
+        order_lines.append(lines)
+    orders = create_in_bulk(Order, orders)
+
+    OrderProduct.objects.bulk_create([
+        OrderProduct(order=order, product=product, quantity=quantity, price=product.price)
+        for order, lines in zip(orders, order_lines)
+        for product, quantity in lines
+    ], batch_size=1000)
+
+    refresh_candidates(order_ids=[order.id for order in orders])
+    for namespace in (CATALOG_NAMESPACE, MENU_NAMESPACE, RESTAURANTS_NAMESPACE, BANNERS_NAMESPACE):
+        transaction.on_commit(lambda namespace=namespace: bump_version(namespace))
+
+    return SimpleNamespace(
+        categories=categories,
+        products=products,
+        restaurants=restaurants,
+        orders=orders,
+    )
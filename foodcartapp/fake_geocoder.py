@@ -0,0 +1,65 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeGeocoderHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            self.send_error(503)
+            return
+
+        address = parse_qs(urlparse(self.path).query).get('geocode', [''])[0]
+        # одинаковый адрес всегда получает одинаковую точку в пределах Москвы
+        digest = hashlib.sha256(address.encode()).digest()
+        latitude = 55.55 + digest[0] / 255 * 0.35
+        longitude = 37.35 + digest[1] / 255 * 0.5
+        body = json.dumps({
+            'response': {
+                'GeoObjectCollection': {
+                    'featureMember': [
+                        {'GeoObject': {'Point': {'pos': f'{longitude:.6f} {latitude:.6f}'}}},
+                    ],
+                },
+            },
+        }).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGeocoderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class FakeGeocoder:
+    def __init__(self, latency=0.0, error_rate=0.0, host='127.0.0.1', port=0):
+        self.server = FakeGeocoderServer((host, port), FakeGeocoderHandler)
+        self.server.latency = latency
+        self.server.error_rate = error_rate
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/1.x'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
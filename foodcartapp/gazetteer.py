@@ -0,0 +1,74 @@
+import csv
+import sqlite3
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .geocoder import BaseGeocoder, normalize_address
+
+
+SQLITE_EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+
+
+class Gazetteer:
+    def __init__(self, rows):
+        self.coordinates_by_address = {}
+        for address, latitude, longitude in rows:
+            self.coordinates_by_address[normalize_address(address)] = (longitude, latitude)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, encoding='utf-8', newline='') as file:
+            return cls(
+                (row['address'], row['latitude'], row['longitude'])
+                for row in csv.DictReader(file)
+            )
+
+    @classmethod
+    def from_sqlite(cls, path):
+        connection = sqlite3.connect(path)
+        try:
+            return cls(connection.execute('SELECT address, latitude, longitude FROM gazetteer'))
+        finally:
+            connection.close()
+
+    @classmethod
+    def from_file(cls, path):
+        if path.endswith(SQLITE_EXTENSIONS):
+            return cls.from_sqlite(path)
+        return cls.from_csv(path)
+
+    def __len__(self):
+        return len(self.coordinates_by_address)
+
+    def lookup(self, address):
+        address = normalize_address(address)
+        if address in self.coordinates_by_address:
+            return self.coordinates_by_address[address]
+
+        # «москва тверская 1 кв 5» найдётся по дому «москва тверская 1»
+        words = address.split()
+        for length in range(len(words) - 1, 0, -1):
+            prefix = ' '.join(words[:length])
+            if prefix in self.coordinates_by_address:
+                return self.coordinates_by_address[prefix]
+        # недописанные адреса не дополняем: «дом 1» нельзя отличить от начала «дом 10»
+        return None
+
+
+class GazetteerGeocoder(BaseGeocoder):
+    def __init__(self, gazetteer):
+        self.gazetteer = gazetteer
+
+    @classmethod
+    def from_settings(cls):
+        if not settings.GEOCODER_GAZETTEER_PATH:
+            raise ImproperlyConfigured('Для локального геокодера нужен файл справочника адресов GEOCODER_GAZETTEER_PATH')
+        return cls(Gazetteer.from_file(settings.GEOCODER_GAZETTEER_PATH))
+
+    def fetch_coordinates(self, address):
+        return self.gazetteer.lookup(address)
+
+    async def afetch_coordinates(self, address):
+        # поиск идёт в памяти, отдельный поток ему не нужен
+        return self.fetch_coordinates(address)
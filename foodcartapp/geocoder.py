@@ -0,0 +1,279 @@
+import asyncio
+import threading
+import time
+import weakref
+from functools import lru_cache
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class GeocoderUnavailable(requests.RequestException):
+    pass
+
+
+class CircuitOpen(GeocoderUnavailable):
+    # запрос не отправлялся: предохранитель ждёт, пока геокодер придёт в себя
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def normalize_address(address):
+    return ' '.join(address.lower().replace(',', ' ').split())
+
+
+def parse_coordinates(response_json):
+    found_places = response_json['response']['GeoObjectCollection']['featureMember']
+
+    if not found_places:
+        return None
+
+    most_relevant = found_places[0]
+    lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
+    return lon, lat
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # пропускаем один пробный запрос, остальные ждут следующего окна
+            self.opened_at = time.monotonic()
+            return True
+
+    def retry_after(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 0
+            return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class GeocoderMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, latency, failed=False):
+        with self._lock:
+            self.requests += 1
+            self.failures += failed
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'latency_total': self.latency_total,
+                'latency_max': self.latency_max,
+            }
+
+
+class BaseGeocoder:
+    @classmethod
+    def from_settings(cls):
+        return cls()
+
+    def fetch_coordinates(self, address):
+        raise NotImplementedError
+
+    async def afetch_coordinates(self, address):
+        return await sync_to_async(self.fetch_coordinates, thread_sensitive=False)(address)
+
+
+class YandexGeocoder(BaseGeocoder):
+    def __init__(self, base_url, api_key, connect_timeout, read_timeout, pool_size,
+                 retries, retry_backoff, circuit_breaker, metrics):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.circuit_breaker = circuit_breaker
+        self.metrics = metrics
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=retry_backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET'],
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=pool_size, max_retries=retry))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=pool_size, max_retries=retry))
+
+        self.async_timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.async_limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.async_retries = retries
+        # у каждого цикла событий свой клиент: соединения httpx к нему привязаны
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            base_url=settings.YANDEX_GEOCODER_URL,
+            api_key=settings.YANDEX_API_KEY,
+            connect_timeout=settings.GEOCODER_CONNECT_TIMEOUT,
+            read_timeout=settings.GEOCODER_READ_TIMEOUT,
+            pool_size=settings.GEOCODER_POOL_SIZE,
+            retries=settings.GEOCODER_RETRIES,
+            retry_backoff=settings.GEOCODER_RETRY_BACKOFF,
+            circuit_breaker=get_circuit_breaker(),
+            metrics=geocoder_metrics,
+        )
+
+    def get_params(self, address):
+        return {
+            "geocode": address,
+            "apikey": self.api_key,
+            "format": "json",
+        }
+
+    def check_circuit(self):
+        if not self.circuit_breaker.allow_request():
+            self.metrics.reject()
+            raise CircuitOpen(
+                'Геокодер не отвечает, запросы к нему временно не отправляются',
+                retry_after=self.circuit_breaker.retry_after(),
+            )
+
+    def parse_response(self, response, started_at):
+        try:
+            coordinates = parse_coordinates(response.json())
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as error:
+            # неожиданный ответ считаем отказом геокодера, как и ошибку HTTP
+            self.metrics.observe(time.perf_counter() - started_at, failed=True)
+            self.circuit_breaker.record_failure()
+            raise GeocoderUnavailable(f'Некорректный ответ геокодера: {error!r}') from error
+
+        self.metrics.observe(time.perf_counter() - started_at)
+        self.circuit_breaker.record_success()
+        return coordinates
+
+    def fetch_coordinates(self, address):
+        self.check_circuit()
+
+        started_at = time.perf_counter()
+        try:
+            response = self.session.get(self.base_url, timeout=self.timeout, params=self.get_params(address))
+            response.raise_for_status()
+        except requests.RequestException:
+            self.metrics.observe(time.perf_counter() - started_at, failed=True)
+            self.circuit_breaker.record_failure()
+            raise
+
+        return self.parse_response(response, started_at)
+
+    async def get_async_client(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            client = httpx.AsyncClient(
+                timeout=self.async_timeout,
+                limits=self.async_limits,
+                transport=httpx.AsyncHTTPTransport(retries=self.async_retries, limits=self.async_limits),
+            )
+            closer = self.close_on_loop_shutdown(loop, client)
+            await closer.asend(None)
+            self._async_clients[loop] = client, closer
+        return self._async_clients[loop][0]
+
+    async def close_on_loop_shutdown(self, loop, client):
+        # незавершённые асинхронные генераторы закрываются при остановке цикла событий
+        # (loop.shutdown_asyncgens в asyncio.run, uvicorn и async_to_sync), а с ними и клиент
+        try:
+            yield
+        finally:
+            self._async_clients.pop(loop, None)
+            await client.aclose()
+
+    async def afetch_coordinates(self, address):
+        self.check_circuit()
+
+        started_at = time.perf_counter()
+        try:
+            client = await self.get_async_client()
+            response = await client.get(self.base_url, params=self.get_params(address))
+            response.raise_for_status()
+        except httpx.HTTPError as error:
+            self.metrics.observe(time.perf_counter() - started_at, failed=True)
+            self.circuit_breaker.record_failure()
+            raise GeocoderUnavailable(str(error)) from error
+
+        return self.parse_response(response, started_at)
+
+
+class FallbackGeocoder(BaseGeocoder):
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    def fetch_coordinates(self, address):
+        try:
+            return self.primary.fetch_coordinates(address)
+        except requests.RequestException:
+            return self.fallback.fetch_coordinates(address)
+
+    async def afetch_coordinates(self, address):
+        try:
+            return await self.primary.afetch_coordinates(address)
+        except requests.RequestException:
+            return await self.fallback.afetch_coordinates(address)
+
+
+geocoder_metrics = GeocoderMetrics()
+
+
+@lru_cache(maxsize=None)
+def get_circuit_breaker():
+    return CircuitBreaker(
+        failure_threshold=settings.GEOCODER_CIRCUIT_FAILURES,
+        reset_timeout=settings.GEOCODER_CIRCUIT_RESET_TIMEOUT,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_geocoder():
+    geocoder = import_string(settings.GEOCODER_BACKEND).from_settings()
+    if settings.GEOCODER_FALLBACK_BACKEND:
+        fallback = import_string(settings.GEOCODER_FALLBACK_BACKEND).from_settings()
+        geocoder = FallbackGeocoder(geocoder, fallback)
+    return geocoder
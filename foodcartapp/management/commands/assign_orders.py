@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodcartapp.assignment import ASSIGNABLE_STATUSES, apply_assignments, plan_assignments
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        'Распределяет новые заказы без ресторана по ресторанам: каждому заказу достаётся '
+        'ресторан, который может приготовить весь заказ, с учётом загрузки кухонь '
+        'и так, чтобы суммарное расстояние было наименьшим'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true',
+                            help='назначить рестораны, а не только показать предложение')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            orders = Order.objects.filter(status__in=ASSIGNABLE_STATUSES, assigned_restaurant__isnull=True)
+            if options['apply']:
+                # пока считаем, менеджеры не должны назначить эти заказы вручную
+                orders = orders.select_for_update()
+            orders = list(orders.order_by('order_date'))
+
+            assignments, solve_time = plan_assignments(orders)
+            for order, restaurant, distance in assignments:
+                self.stdout.write(f'Заказ {order.id} ({order.address}) → {restaurant.name}, {distance:.2f} км')
+
+            if options['apply']:
+                apply_assignments(assignments)
+
+        total_distance = sum(distance for _, _, distance in assignments)
+        self.stdout.write(
+            f'{"Назначено" if options["apply"] else "Можно назначить"} заказов: '
+            f'{len(assignments)} из {len(orders)}, суммарное расстояние {total_distance:.2f} км, '
+            f'расчёт занял {solve_time * 1000:.1f} мс'
+        )
@@ -0,0 +1,70 @@
+import random
+import time
+from decimal import Decimal
+from math import sin, cos, sqrt, atan2, radians
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodcartapp.utils import sort_by_distance
+
+
+def calculate_distance_in_python(lat1, lon1, lat2, lon2):
+    earth_radius_in_km = 6371
+
+    lat1 = radians(float(lat1))
+    lon1 = radians(float(lon1))
+    lat2 = radians(float(lat2))
+    lon2 = radians(float(lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    sin_half_dist_sqr = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    central_angle = 2 * atan2(sqrt(sin_half_dist_sqr), sqrt(1 - sin_half_dist_sqr))
+
+    return earth_radius_in_km * central_angle
+
+
+def generate_coordinates(count):
+    # точки в пределах Москвы, в том же Decimal-виде, что хранится в базе
+    return [
+        (
+            Decimal(f'{random.uniform(55.55, 55.92):.6f}'),
+            Decimal(f'{random.uniform(37.35, 37.85):.6f}'),
+        )
+        for _ in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает расчёт расстояний от заказов до ресторанов в цикле и матрицей NumPy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--restaurants', type=int, default=200)
+
+    def handle(self, *args, **options):
+        orders = generate_coordinates(options['orders'])
+        restaurants = generate_coordinates(options['restaurants'])
+
+        started_at = time.perf_counter()
+        loop_nearest = []
+        for order_lat, order_lon in orders:
+            distances = [
+                (calculate_distance_in_python(order_lat, order_lon, restaurant_lat, restaurant_lon), index)
+                for index, (restaurant_lat, restaurant_lon) in enumerate(restaurants)
+            ]
+            distances.sort()
+            loop_nearest.append(distances[0][1])
+        loop_seconds = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        _, nearest = sort_by_distance(orders, restaurants)
+        matrix_seconds = time.perf_counter() - started_at
+
+        if loop_nearest != list(nearest[:, 0]):
+            raise CommandError('Ближайшие рестораны в цикле и в матрице не совпадают')
+
+        self.stdout.write(f'{options["orders"]} заказов x {options["restaurants"]} ресторанов')
+        self.stdout.write(f'цикл:    {loop_seconds * 1000:.1f} мс')
+        self.stdout.write(f'матрица: {matrix_seconds * 1000:.1f} мс')
+        self.stdout.write(f'ускорение: {loop_seconds / matrix_seconds:.1f}x')
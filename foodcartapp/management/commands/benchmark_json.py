@@ -0,0 +1,61 @@
+import json
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from foodcartapp.renderers import django_json_encoder, orjson
+
+
+def generate_catalog(size):
+    categories = [{'id': number, 'name': f'Категория {number}'} for number in range(10)]
+    return [
+        {
+            'id': number,
+            'name': f'Бургер №{number}',
+            'price': Decimal(random.randint(10000, 99999)) / 100,
+            'special_status': random.random() < 0.1,
+            'description': 'Сочная котлета из мраморной говядины, свежие овощи и фирменный соус',
+            'category': random.choice(categories),
+            'image': f'/media/burger_{number}.jpg',
+            'restaurant': {
+                'id': number,
+                'name': f'Бургер №{number}',
+            },
+        }
+        for number in range(size)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает размер и время кодирования каталога товаров в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        catalog = generate_catalog(options['products'])
+        encoders = {
+            'json, indent=4': lambda data: json.dumps(
+                data, cls=DjangoJSONEncoder, ensure_ascii=False, indent=4,
+            ).encode(),
+            'json, compact': lambda data: json.dumps(
+                data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'),
+            ).encode(),
+        }
+        if orjson:
+            encoders['orjson'] = lambda data: orjson.dumps(data, default=django_json_encoder.default)
+        else:
+            self.stdout.write('orjson не установлен, пропускаю')
+
+        self.stdout.write(f'{"кодировщик":<16} {"байт":>8} {"мс":>8}')
+        for name, encode in encoders.items():
+            content = encode(catalog)
+            started_at = time.perf_counter()
+            for _ in range(options['repeat']):
+                encode(catalog)
+            elapsed_ms = (time.perf_counter() - started_at) * 1000 / options['repeat']
+            self.stdout.write(f'{name:<16} {len(content):>8} {elapsed_ms:>8.3f}')
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from foodcartapp.models import Product
+from foodcartapp.serializers import OrderSerializer
+
+
+class Command(BaseCommand):
+    help = 'Замеряет число SQL-запросов и время создания заказа для корзин разного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cart-sizes', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # все созданные товары и заказы откатываются в конце замера
+        with transaction.atomic():
+            products = Product.objects.bulk_create([
+                Product(name=f'benchmark {number}', price=100 + number, image='benchmark.jpg')
+                for number in range(max(options['cart_sizes']))
+            ])
+            if not products[0].pk:
+                products = list(Product.objects.filter(name__startswith='benchmark ').order_by('pk'))
+
+            self.stdout.write(f'{"позиций":>8} {"запросов":>9} {"мс на заказ":>12}')
+            for cart_size in options['cart_sizes']:
+                payload = {
+                    'firstname': 'Иван',
+                    'lastname': 'Петров',
+                    'phonenumber': '+79261234567',
+                    'address': 'Москва, Красная площадь, 1',
+                    'products': [
+                        {'product': product.pk, 'quantity': 2}
+                        for product in products[:cart_size]
+                    ],
+                }
+
+                with CaptureQueriesContext(connection) as queries:
+                    self.create_order(payload)
+                queries_count = len(queries)
+
+                started_at = time.perf_counter()
+                for _ in range(options['repeat']):
+                    self.create_order(payload)
+                elapsed_ms = (time.perf_counter() - started_at) * 1000 / options['repeat']
+
+                self.stdout.write(f'{cart_size:>8} {queries_count:>9} {elapsed_ms:>12.2f}')
+
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def create_order(payload):
+        # транзакция замера откатывается, поэтому обработчики on_commit, которые пересчитывают
+        # рестораны-кандидаты, запускаем сами, как после настоящего коммита
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            serializer = OrderSerializer(data=payload)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from foodcartapp.cache import RESTAURANTS_NAMESPACE, bump_version
+from foodcartapp.candidates import refresh_candidates
+from foodcartapp.geocoder import normalize_address
+from foodcartapp.models import GeocodingTask, Order, Restaurant
+from foodcartapp.models import GEOCODING_DONE, GEOCODING_PENDING
+from foodcartapp.utils import fetch_coordinates, get_cached_coordinates_bulk, save_cached_coordinates_bulk
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_request_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self.next_request_at - now
+            self.next_request_at = max(now, self.next_request_at) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Command(BaseCommand):
+    help = 'Определяет координаты заказов и ресторанов, у которых их нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=['orders', 'restaurants'],
+                            help='обработать только заказы или только рестораны')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='сколько запросов к геокодеру выполнять одновременно')
+        parser.add_argument('--rate-limit', type=float, default=0,
+                            help='не больше стольких запросов к геокодеру в секунду, 0 — без ограничения')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='сколько разных адресов обрабатывать за шаг')
+        parser.add_argument('--checkpoint',
+                            help='файл с уже обработанными адресами, чтобы продолжить с того же места')
+
+    def handle(self, *args, **options):
+        models = [Order, Restaurant]
+        if options['only'] == 'orders':
+            models = [Order]
+        elif options['only'] == 'restaurants':
+            models = [Restaurant]
+
+        processed_addresses = self.load_checkpoint(options['checkpoint'])
+        raw_addresses = {}
+        objects_by_address = defaultdict(list)
+        for model in models:
+            missing = (
+                model.objects
+                .filter(Q(latitude__isnull=True) | Q(longitude__isnull=True))
+                .exclude(address='')
+                .only('id', 'address')
+            )
+            for obj in missing.iterator():
+                address = normalize_address(obj.address)
+                if address in processed_addresses:
+                    continue
+                raw_addresses.setdefault(address, obj.address)
+                objects_by_address[address].append(obj)
+
+        addresses = sorted(raw_addresses)
+        self.stdout.write(f'Адресов без координат: {len(addresses)}')
+
+        rate_limiter = RateLimiter(options['rate_limit'])
+
+        def geocode(address):
+            rate_limiter.wait()
+            try:
+                return address, fetch_coordinates(raw_addresses[address]), None
+            except requests.RequestException as error:
+                return address, None, error
+
+        found_count = failed_count = 0
+        restaurants_updated = False
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for start in range(0, len(addresses), options['batch_size']):
+                chunk = addresses[start:start + options['batch_size']]
+
+                cached = get_cached_coordinates_bulk(chunk)
+                coordinates_by_address = {address: cached[address].coordinates for address in cached}
+                misses = [address for address in chunk if address not in cached]
+                fetched = {}
+                for address, coordinates, error in executor.map(geocode, misses):
+                    if error:
+                        failed_count += 1
+                        self.stderr.write(f'{raw_addresses[address]}: {error}')
+                        continue
+                    fetched[address] = coordinates
+                save_cached_coordinates_bulk(fetched)
+                coordinates_by_address.update(fetched)
+
+                updated = self.save_coordinates(coordinates_by_address, objects_by_address, options['batch_size'])
+                found_count += sum(1 for coordinates in coordinates_by_address.values() if coordinates)
+                restaurants_updated = restaurants_updated or bool(updated[Restaurant])
+
+                processed_addresses.update(coordinates_by_address)
+                self.save_checkpoint(options['checkpoint'], processed_addresses)
+                self.stdout.write(
+                    f'Обработано адресов: {min(start + len(chunk), len(addresses))} из {len(addresses)}'
+                )
+
+        if restaurants_updated:
+            # bulk_update не отправляет сигналы, индекс ресторанов сбрасываем сами
+            # и пересчитываем ближайшие рестораны уже по новому индексу
+            bump_version(RESTAURANTS_NAMESPACE)
+            refresh_candidates()
+
+        self.stdout.write(
+            f'Координаты найдены: {found_count}, не найдены: '
+            f'{len(addresses) - found_count - failed_count}, ошибок геокодера: {failed_count}'
+        )
+
+    @staticmethod
+    def save_coordinates(coordinates_by_address, objects_by_address, batch_size):
+        now = timezone.now()
+        updated = defaultdict(list)
+        for address, coordinates in coordinates_by_address.items():
+            if not coordinates:
+                continue
+            for obj in objects_by_address[address]:
+                obj.longitude, obj.latitude = coordinates
+                updated[type(obj)].append(obj)
+        for order in updated[Order]:
+            order.updated_at = now
+
+        with transaction.atomic():
+            for model, objects in updated.items():
+                fields = ['latitude', 'longitude', 'updated_at'] if model is Order else ['latitude', 'longitude']
+                model.objects.bulk_update(objects, fields, batch_size=batch_size)
+            # заказы с найденными координатами больше не ждут фонового обработчика
+            GeocodingTask.objects.filter(
+                order__in=updated[Order],
+                status=GEOCODING_PENDING,
+            ).update(status=GEOCODING_DONE, processed_at=now, error='')
+            # bulk_update не отправляет сигналы, расстояния до ресторанов обновляем сами
+            if updated[Order]:
+                refresh_candidates(order_ids=[order.id for order in updated[Order]], touch_orders=True)
+        return updated
+
+    @staticmethod
+    def load_checkpoint(path):
+        if not path or not os.path.exists(path):
+            return set()
+        with open(path, encoding='utf-8') as file:
+            return set(json.load(file)['processed_addresses'])
+
+    @staticmethod
+    def save_checkpoint(path, processed_addresses):
+        if not path:
+            return
+        # пишем во временный файл и подменяем, чтобы прерванный запуск не испортил отметку
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump({'processed_addresses': sorted(processed_addresses)}, file, ensure_ascii=False)
+        os.replace(temporary_path, path)
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.geocoder import geocoder_metrics
+from foodcartapp.utils import geocode_pending_orders
+
+
+class Command(BaseCommand):
+    help = 'Определяет координаты новых заказов из очереди задач геокодирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='сколько задач брать из очереди за раз')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='после скольких неудачных попыток задача считается проваленной')
+        parser.add_argument('--sleep', type=float, default=5,
+                            help='пауза в секундах, если очередь пуста или геокодер не ответил ни на один адрес')
+        parser.add_argument('--once', action='store_true',
+                            help='обработать одну пачку задач и выйти')
+
+    def handle(self, *args, **options):
+        while True:
+            processed, failed = geocode_pending_orders(options['batch_size'], options['max_attempts'])
+
+            if processed:
+                metrics = geocoder_metrics.snapshot()
+                self.stdout.write(
+                    f'Обработано задач: {processed}. '
+                    f'Запросов к геокодеру: {metrics["requests"]}, ошибок: {metrics["failures"]}, '
+                    f'отклонено: {metrics["rejected"]}, время ответа: {metrics["latency_total"]:.1f} с'
+                )
+            if options['once']:
+                break
+            # если не удалось ни одной задачи, геокодер, скорее всего, недоступен: не долбим его
+            if not processed or failed == processed:
+                time.sleep(options['sleep'])
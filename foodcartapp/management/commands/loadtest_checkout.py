@@ -0,0 +1,340 @@
+import asyncio
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError, OperationalError, connection, connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from foodcartapp.fake_geocoder import FakeGeocoder
+from foodcartapp.geocoder import get_circuit_breaker, get_geocoder
+from foodcartapp.models import GeocodeCache, Order, Product
+from foodcartapp.serializers import OrderSerializer
+from foodcartapp.utils import geocode_pending_orders, get_coordinates
+
+
+LOADTEST_LASTNAME = 'Нагрузочный'
+YANDEX_BACKEND = 'foodcartapp.geocoder.YandexGeocoder'
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+# в корзине чаще одна-две позиции, чем пять-шесть, и обычно по одной штуке
+QUANTITY_WEIGHTS = {1: 70, 2: 20, 3: 10}
+
+
+class LockWaitMonitor:
+    # в Postgres ожидающие блокировку запросы видны в pg_stat_activity,
+    # в SQLite ожидание блокировки базы входит во время пишущих запросов
+    def __init__(self, sample_interval):
+        self.sample_interval = sample_interval
+        self.is_postgres = connection.vendor == 'postgresql'
+        self.wait_seconds = 0.0
+        self.max_waiting = 0
+        self.write_seconds = 0.0
+        self.max_write_seconds = 0.0
+        self.locked_errors = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self.sample, daemon=True)
+
+    def __enter__(self):
+        if self.is_postgres:
+            self._sampler.start()
+        else:
+            connection_created.connect(self.install)
+            for database_connection in connections.all():
+                self.install(database_connection.__class__, database_connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        if self.is_postgres:
+            self._sampler.join()
+        else:
+            connection_created.disconnect(self.install)
+
+    def install(self, sender, connection, **kwargs):
+        if self.record_write not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.record_write)
+
+    def record_write(self, execute, sql, params, many, context):
+        if self._stopped.is_set() or not sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+            return execute(sql, params, many, context)
+
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as error:
+            if 'locked' in str(error):
+                with self._lock:
+                    self.locked_errors += 1
+            raise
+        finally:
+            duration = time.perf_counter() - started_at
+            with self._lock:
+                self.write_seconds += duration
+                self.max_write_seconds = max(self.max_write_seconds, duration)
+
+    def sample(self):
+        try:
+            with connections['default'].cursor() as cursor:
+                while not self._stopped.wait(self.sample_interval):
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                    )
+                    waiting = cursor.fetchone()[0]
+                    self.wait_seconds += waiting * self.sample_interval
+                    self.max_waiting = max(self.max_waiting, waiting)
+        finally:
+            connections.close_all()
+
+    def describe(self, is_remote):
+        if self.is_postgres:
+            return (
+                f'ожидание блокировок {self.wait_seconds:.2f} с суммарно, '
+                f'до {self.max_waiting} запросов одновременно'
+            )
+        if is_remote:
+            return 'ожидание блокировок SQLite не измерялось: сервер работает в другом процессе'
+        return (
+            f'пишущие запросы с ожиданием блокировки SQLite {self.write_seconds:.2f} с суммарно, '
+            f'самый долгий {self.max_write_seconds * 1000:.0f} мс, '
+            f'ошибок database is locked {self.locked_errors}'
+        )
+
+
+class GeocodingWorker(threading.Thread):
+    # фоновый обработчик очереди, как geocode_orders, пишет в те же таблицы, что и приём заказов
+    def __init__(self, batch_size=50, max_attempts=5, idle_sleep=0.1):
+        super().__init__(daemon=True)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.idle_sleep = idle_sleep
+        self.processed = 0
+        self.errors = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stopped.is_set():
+                try:
+                    processed, failed = geocode_pending_orders(self.batch_size, self.max_attempts)
+                except DatabaseError:
+                    self.errors += 1
+                    processed = failed = 0
+                self.processed += processed
+                if not processed or failed == processed:
+                    self._stopped.wait(self.idle_sleep)
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест приёма заказов с локальной заглушкой геокодера: '
+        'асинхронный /api/order/async/, синхронный /api/order/ с очередью геокодирования '
+        'и старый синхронный приём, который ждёт геокодер в одном из нескольких воркеров'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['async', 'api', 'sync', 'all'], default='all',
+                            help='async — /api/order/async/, api — /api/order/, '
+                                 'sync — сохранение заказа с геокодированием внутри запроса')
+        parser.add_argument('--requests', type=int, default=500, help='сколько заказов отправить')
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help='сколько заказов одновременно в полёте в асинхронном режиме')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='сколько синхронных воркеров, как у gunicorn')
+        parser.add_argument('--max-cart-size', type=int, default=6, help='сколько разных товаров в корзине')
+        parser.add_argument('--seed', type=int, default=None, help='для повторяемых корзин')
+        parser.add_argument('--geocoder-latency', type=float, default=0.3, help='задержка геокодера, с')
+        parser.add_argument('--geocoder-error-rate', type=float, default=0.0, help='доля ответов 503')
+        parser.add_argument('--geocoder-port', type=int, default=0,
+                            help='порт заглушки геокодера, по умолчанию любой свободный')
+        parser.add_argument('--target',
+                            help='адрес запущенного сайта, например http://127.0.0.1:8000; '
+                                 'без него запросы обрабатываются в этом же процессе')
+        parser.add_argument('--with-worker', action='store_true',
+                            help='параллельно разбирать очередь геокодирования, как geocode_orders')
+        parser.add_argument('--lock-sample-interval', type=float, default=0.05,
+                            help='как часто опрашивать pg_stat_activity в Postgres, с')
+        parser.add_argument('--keep', action='store_true', help='не удалять созданные заказы')
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.available().values_list('id', flat=True))
+        if not product_ids:
+            raise CommandError('Нет товаров в продаже, заказывать нечего')
+
+        run_id = uuid.uuid4().hex[:8]
+        rng = random.Random(options['seed'])
+        modes = ['async', 'api', 'sync'] if options['mode'] == 'all' else [options['mode']]
+
+        with FakeGeocoder(options['geocoder_latency'], options['geocoder_error_rate'],
+                          port=options['geocoder_port']) as geocoder:
+            if options['target']:
+                self.stdout.write(
+                    f'Заглушка геокодера: {geocoder.url}. Запустите сайт с YANDEX_GEOCODER_URL={geocoder.url}'
+                )
+            with override_settings(YANDEX_GEOCODER_URL=geocoder.url, GEOCODER_BACKEND=YANDEX_BACKEND,
+                                   GEOCODER_FALLBACK_BACKEND=''):
+                self.reset_geocoders()
+                try:
+                    for mode in modes:
+                        payloads = self.make_payloads(
+                            f'{run_id} {mode}', options['requests'], product_ids, options['max_cart_size'], rng,
+                        )
+                        self.run_mode(mode, payloads, options)
+                finally:
+                    self.reset_geocoders()
+
+        if not options['keep']:
+            Order.objects.filter(lastname=LOADTEST_LASTNAME, address__contains=run_id).delete()
+            GeocodeCache.objects.filter(address__contains=run_id).delete()
+
+    def run_mode(self, mode, payloads, options):
+        is_remote = bool(options['target']) and mode != 'sync'
+        worker = GeocodingWorker() if options['with_worker'] else None
+        with LockWaitMonitor(options['lock_sample_interval']) as lock_monitor:
+            if worker:
+                worker.start()
+            try:
+                if mode == 'async':
+                    results = asyncio.run(self.run_async(payloads, options['concurrency'], options['target']))
+                    title = f'async, {options["concurrency"]} одновременно'
+                elif mode == 'api':
+                    results = self.run_api(payloads, options['workers'], options['target'])
+                    title = f'api, {options["workers"]} воркера'
+                else:
+                    results = self.run_sync(payloads, options['workers'])
+                    title = f'sync, {options["workers"]} воркера'
+            finally:
+                if worker:
+                    worker.stop()
+
+        self.report(title, results)
+        self.stdout.write(f'  {lock_monitor.describe(is_remote)}')
+        if worker:
+            self.stdout.write(f'  фоновый геокодер обработал задач: {worker.processed}, ошибок базы: {worker.errors}')
+
+    @staticmethod
+    def reset_geocoders():
+        # клиенты геокодера создаются один раз и запоминают адрес из настроек
+        get_circuit_breaker.cache_clear()
+        get_geocoder.cache_clear()
+
+    @staticmethod
+    def make_payloads(run_id, count, product_ids, max_cart_size, rng):
+        cart_sizes = range(1, min(max_cart_size, len(product_ids)) + 1)
+        payloads = []
+        for number in range(count):
+            cart_size = rng.choices(cart_sizes, weights=[1 / size for size in cart_sizes])[0]
+            payloads.append({
+                'firstname': 'Тест',
+                'lastname': LOADTEST_LASTNAME,
+                'phonenumber': '+79261234567',
+                # уникальный адрес, чтобы каждый заказ доходил до геокодера
+                'address': f'Москва, нагрузочный тест {run_id}, дом {number}',
+                'products': [
+                    {
+                        'product': product_id,
+                        'quantity': rng.choices(list(QUANTITY_WEIGHTS), weights=QUANTITY_WEIGHTS.values())[0],
+                    }
+                    for product_id in rng.sample(product_ids, cart_size)
+                ],
+            })
+        return payloads
+
+    async def run_async(self, payloads, concurrency, target):
+        semaphore = asyncio.Semaphore(concurrency)
+        if target:
+            client = httpx.AsyncClient(base_url=target, timeout=None)
+        else:
+            transport = httpx.ASGITransport(app=get_asgi_application())
+            client = httpx.AsyncClient(transport=transport, base_url='http://localhost', timeout=None)
+
+        async with client:
+            async def send(payload):
+                async with semaphore:
+                    started_at = time.perf_counter()
+                    try:
+                        response = await client.post('/api/order/async/', json=payload)
+                        succeeded = response.status_code == 200
+                    except httpx.HTTPError:
+                        succeeded = False
+                    return time.perf_counter() - started_at, succeeded
+
+            started_at = time.perf_counter()
+            results = await asyncio.gather(*(send(payload) for payload in payloads))
+            return time.perf_counter() - started_at, results
+
+    def run_api(self, payloads, workers, target):
+        app = None if target else get_wsgi_application()
+        clients = threading.local()
+
+        def send(payload):
+            # у каждого потока свой клиент, запрос обрабатывается в том же потоке, как в воркере gunicorn
+            if not hasattr(clients, 'client'):
+                if target:
+                    clients.client = httpx.Client(base_url=target, timeout=None)
+                else:
+                    clients.client = httpx.Client(transport=httpx.WSGITransport(app=app),
+                                                  base_url='http://localhost', timeout=None)
+            started_at = time.perf_counter()
+            try:
+                response = clients.client.post('/api/order/', json=payload)
+                succeeded = response.status_code == 200
+            except httpx.HTTPError:
+                succeeded = False
+            finally:
+                if not target:
+                    connections.close_all()
+            return time.perf_counter() - started_at, succeeded
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(send, payloads))
+        return time.perf_counter() - started_at, results
+
+    def run_sync(self, payloads, workers):
+        def send(payload):
+            started_at = time.perf_counter()
+            try:
+                # так заказ принимался раньше: воркер ждёт геокодер внутри запроса
+                serializer = OrderSerializer(data=payload)
+                serializer.is_valid(raise_exception=True)
+                coordinates = get_coordinates(payload['address'])
+                serializer.save(coordinates=coordinates)
+                succeeded = True
+            except Exception:
+                succeeded = False
+            finally:
+                connections.close_all()
+            return time.perf_counter() - started_at, succeeded
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(send, payloads))
+        return time.perf_counter() - started_at, results
+
+    def report(self, title, results):
+        elapsed, results = results
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(1 for _, succeeded in results if not succeeded)
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        self.stdout.write(
+            f'{title}: {len(results)} заказов за {elapsed:.2f} с, '
+            f'{len(results) / elapsed:.1f} заказов/с, '
+            f'p50 {percentiles[49] * 1000:.0f} мс, p95 {percentiles[94] * 1000:.0f} мс, '
+            f'p99 {percentiles[98] * 1000:.0f} мс, ошибок {errors}'
+        )
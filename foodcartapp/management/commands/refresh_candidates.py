@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.candidates import refresh_candidates
+from foodcartapp.models import OrderRestaurantCandidate
+
+
+class Command(BaseCommand):
+    help = 'Заново рассчитывает рестораны-кандидаты и расстояния до них для всех незавершённых заказов'
+
+    def handle(self, *args, **options):
+        refresh_candidates()
+        self.stdout.write(f'Записано пар заказ — ресторан: {OrderRestaurantCandidate.objects.count()}')
@@ -0,0 +1,196 @@
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from foodcartapp.assignment import ASSIGNABLE_STATUSES, plan_assignments
+from foodcartapp.cache import BANNERS_NAMESPACE, CATALOG_NAMESPACE, MENU_NAMESPACE, RESTAURANTS_NAMESPACE
+from foodcartapp.cache import bump_version
+from foodcartapp.candidates import refresh_candidates
+from foodcartapp.datagen import generate_dataset
+from foodcartapp.models import Order
+from foodcartapp.models import UNPROCESSED_STATUSES
+from foodcartapp.utils import (
+    calculate_distance,
+    calculate_distance_matrix,
+    get_eligible_restaurants,
+    get_eligible_restaurants_by_order,
+)
+
+
+CACHE_NAMESPACES = (CATALOG_NAMESPACE, MENU_NAMESPACE, RESTAURANTS_NAMESPACE, BANNERS_NAMESPACE)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время и число SQL-запросов основных страниц, API и расчётов на синтетических '
+        'данных разного размера и сохраняет результаты в JSON для сравнения между коммитами. '
+        'Данные создаются в транзакции и откатываются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000],
+                            help='сколько заказов в наборе данных; товаров в три раза, '
+                                 'а ресторанов в десять раз меньше')
+        parser.add_argument('--repeat', type=int, default=5, help='сколько раз повторять каждый замер')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='файл для результатов, по умолчанию JSON пишется в консоль')
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        results = {
+            'commit': get_commit(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'repeat': self.repeat,
+            'sizes': [],
+        }
+
+        # строки метрик по каждому запросу только зашумят вывод
+        metrics_logger = logging.getLogger('star_burger.metrics')
+        metrics_log_level = metrics_logger.level
+        metrics_logger.setLevel(logging.ERROR)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for size in options['sizes']:
+                    results['sizes'].append(self.run_size(size, options['seed']))
+        finally:
+            metrics_logger.setLevel(metrics_log_level)
+
+        content = json.dumps(results, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content)
+            self.report(results)
+        else:
+            self.stdout.write(content)
+
+    def run_size(self, size, seed):
+        dataset_options = {
+            'orders_count': size,
+            'products_count': max(size // 3, 10),
+            'restaurants_count': max(size // 10, 5),
+        }
+        # кэш не знает об откатанных данных, поэтому версии сбрасываются до и после замера
+        self.bump_cache_versions()
+        try:
+            with transaction.atomic():
+                started_at = time.perf_counter()
+                dataset = generate_dataset(seed=seed, **dataset_options)
+                self.bump_cache_versions()
+                seed_seconds = time.perf_counter() - started_at
+
+                benchmarks = self.run_benchmarks(dataset)
+                transaction.set_rollback(True)
+        finally:
+            self.bump_cache_versions()
+
+        return {
+            'size': size,
+            'dataset': {**dataset_options, 'seed_seconds': round(seed_seconds, 2)},
+            'benchmarks': benchmarks,
+        }
+
+    def run_benchmarks(self, dataset):
+        orders = list(Order.objects.filter(status__in=UNPROCESSED_STATUSES))
+        assignable_orders = [order for order in orders if order.status in ASSIGNABLE_STATUSES]
+        order = orders[0]
+        restaurant = dataset.restaurants[0]
+        orders_coordinates = [(order.latitude, order.longitude) for order in orders]
+        restaurants_coordinates = [(restaurant.latitude, restaurant.longitude) for restaurant in dataset.restaurants]
+
+        manager = get_user_model().objects.create_superuser(f'benchmark-{uuid.uuid4().hex[:8]}')
+        client = Client()
+        client.force_login(manager)
+        order_payload = {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79261234567',
+            'address': 'Москва, Красная площадь, 1',
+            'products': [{'product': product.id, 'quantity': 2} for product in dataset.products[:5]],
+        }
+
+        def get(url):
+            return lambda: client.get(url)
+
+        def create_order():
+            # транзакция замера откатывается, поэтому обработчики on_commit запускаем сами
+            with TestCase.captureOnCommitCallbacks(execute=True):
+                client.post(reverse('foodcartapp:order_create'), order_payload, content_type='application/json')
+
+        return {
+            'get_eligible_restaurants': self.measure(lambda: get_eligible_restaurants(order)),
+            'get_eligible_restaurants_by_order': self.measure(lambda: get_eligible_restaurants_by_order(orders)),
+            'calculate_distance': self.measure(
+                lambda: calculate_distance(order.latitude, order.longitude, restaurant.latitude, restaurant.longitude)
+            ),
+            'calculate_distance_matrix': self.measure(
+                lambda: calculate_distance_matrix(orders_coordinates, restaurants_coordinates)
+            ),
+            'refresh_candidates': self.measure(refresh_candidates),
+            'plan_assignments': self.measure(lambda: plan_assignments(assignable_orders)),
+            'api:products (cold cache)': self.measure(
+                get(reverse('foodcartapp:product_list')),
+                setup=lambda: bump_version(CATALOG_NAMESPACE),
+            ),
+            'api:products': self.measure(get(reverse('foodcartapp:product_list'))),
+            'api:order_create': self.measure(create_order),
+            'manager:view_orders': self.measure(get(reverse('restaurateur:view_orders'))),
+            'manager:products': self.measure(get(reverse('restaurateur:ProductsView'))),
+            'manager:restaurants': self.measure(get(reverse('restaurateur:RestaurantView'))),
+            'admin:order_change': self.measure(get(reverse('admin:foodcartapp_order_change', args=[order.id]))),
+        }
+
+    def measure(self, function, setup=None):
+        # первый прогон прогревает кэши и не учитывается
+        function()
+        timings = []
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            with CaptureQueriesContext(connection) as queries:
+                started_at = time.perf_counter()
+                function()
+                timings.append((time.perf_counter() - started_at) * 1000)
+        return {
+            'queries': len(queries),
+            'min_ms': round(min(timings), 3),
+            'median_ms': round(statistics.median(timings), 3),
+            'max_ms': round(max(timings), 3),
+        }
+
+    @staticmethod
+    def bump_cache_versions():
+        for namespace in CACHE_NAMESPACES:
+            bump_version(namespace)
+
+    def report(self, results):
+        for size_results in results['sizes']:
+            self.stdout.write(f'\nЗаказов: {size_results["size"]}')
+            self.stdout.write(f'{"замер":<36} {"запросов":>9} {"медиана, мс":>12}')
+            for name, benchmark in size_results['benchmarks'].items():
+                self.stdout.write(f'{name:<36} {benchmark["queries"]:>9} {benchmark["median_ms"]:>12.2f}')
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохранённую сумму заказов по позициям заказа'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='только проверить суммы, ничего не меняя')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        mismatched_orders = (
+            Order.objects
+            .with_calculated_total_cost()
+            .exclude(total_cost=F('calculated_total_cost'))
+            .only('id', 'total_cost')
+            .order_by('id')
+        )
+
+        if options['verify']:
+            mismatched_count = 0
+            for order in mismatched_orders.iterator():
+                mismatched_count += 1
+                self.stdout.write(
+                    f'Заказ {order.id}: сохранено {order.total_cost}, по позициям {order.calculated_total_cost}'
+                )
+            if mismatched_count:
+                raise CommandError(f'Суммы не совпадают у заказов: {mismatched_count}')
+            self.stdout.write('Суммы всех заказов совпадают')
+            return
+
+        updated_count = 0
+        batch = []
+        for order in mismatched_orders.iterator():
+            order.total_cost = order.calculated_total_cost
+            batch.append(order)
+            if len(batch) >= options['batch_size']:
+                Order.objects.bulk_update(batch, ['total_cost'])
+                updated_count += len(batch)
+                batch = []
+        Order.objects.bulk_update(batch, ['total_cost'])
+        updated_count += len(batch)
+        self.stdout.write(f'Обновлено заказов: {updated_count}')
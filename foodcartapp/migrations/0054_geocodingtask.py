@@ -0,0 +1,31 @@
+# Generated by Django 3.2.15 on 2026-10-18 15:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0053_geocodecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodingTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('в очереди', 'в очереди'), ('выполнено', 'выполнено'), ('ошибка', 'ошибка')], db_index=True, default='в очереди', max_length=20, verbose_name='статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='попыток')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='дата создания')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='дата обработки')),
+                ('error', models.TextField(blank=True, verbose_name='ошибка')),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='geocoding_task', to='foodcartapp.order', verbose_name='заказ')),
+            ],
+            options={
+                'verbose_name': 'задача геокодирования',
+                'verbose_name_plural': 'задачи геокодирования',
+            },
+        ),
+    ]
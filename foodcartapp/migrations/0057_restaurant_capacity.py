@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0056_order_total_cost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='capacity',
+            field=models.PositiveIntegerField(default=10, verbose_name='сколько заказов готовит одновременно'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.15 on 2026-10-18 15:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0058_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderRestaurantCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.FloatField(blank=True, null=True, verbose_name='расстояние, км')),
+                ('can_prepare', models.BooleanField(default=False, verbose_name='может приготовить весь заказ')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='restaurant_candidates', to='foodcartapp.order', verbose_name='заказ')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_candidates', to='foodcartapp.restaurant', verbose_name='ресторан')),
+            ],
+            options={
+                'verbose_name': 'ресторан для заказа',
+                'verbose_name_plural': 'рестораны для заказов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='orderrestaurantcandidate',
+            index=models.Index(fields=['order', 'can_prepare', 'distance'], name='candidate_order_distance_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='orderrestaurantcandidate',
+            unique_together={('order', 'restaurant')},
+        ),
+    ]
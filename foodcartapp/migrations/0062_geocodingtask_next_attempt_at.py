@@ -0,0 +1,19 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0061_copy_banners_from_assets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geocodingtask',
+            name='next_attempt_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='раньше этого времени задача из очереди не берётся', verbose_name='следующая попытка'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_order_total_cost(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    OrderProduct = apps.get_model('foodcartapp', 'OrderProduct')
+    order_total_cost = (
+        OrderProduct.objects
+        .filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total_cost=Sum(F('quantity') * F('price')))
+        .values('total_cost')
+    )
+    # заказы, созданные после 0056, сумму уже получили, пересчитываем только нулевые
+    Order.objects.filter(total_cost=0).update(
+        total_cost=Coalesce(
+            Subquery(order_total_cost),
+            Value(0),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0062_geocodingtask_next_attempt_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_order_total_cost, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import F, Sum
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 
@@ -34,6 +35,10 @@ class Restaurant(models.Model):
         blank=True,
         verbose_name="долгота"
     )
+    capacity = models.PositiveIntegerField(
+        'сколько заказов готовит одновременно',
+        default=10,
+    )
 
     class Meta:
         verbose_name = 'ресторан'
@@ -113,6 +118,55 @@ class Product(models.Model):
         return self.name
 
 
+class BannerQuerySet(models.QuerySet):
+    def active(self, now=None):
+        now = now or timezone.now()
+        return self.filter(
+            Q(active_from__isnull=True) | Q(active_from__lte=now),
+            Q(active_until__isnull=True) | Q(active_until__gt=now),
+        )
+
+
+class Banner(models.Model):
+    title = models.CharField(
+        'заголовок',
+        max_length=50,
+    )
+    text = models.CharField(
+        'текст',
+        max_length=200,
+        blank=True,
+    )
+    image = models.ImageField(
+        'картинка'
+    )
+    position = models.PositiveIntegerField(
+        'порядок',
+        default=0,
+        db_index=True,
+    )
+    active_from = models.DateTimeField(
+        'показывать с',
+        null=True,
+        blank=True,
+    )
+    active_until = models.DateTimeField(
+        'показывать до',
+        null=True,
+        blank=True,
+    )
+
+    objects = BannerQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'баннер'
+        verbose_name_plural = 'баннеры'
+        ordering = ['position', 'id']
+
+    def __str__(self):
+        return self.title
+
+
 class RestaurantMenuItem(models.Model):
     restaurant = models.ForeignKey(
         Restaurant,
@@ -143,10 +197,14 @@ class RestaurantMenuItem(models.Model):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
-class OrderManager(models.Manager):
-    def get_queryset(self):
-        return super().get_queryset().annotate(
-            total_cost=Sum(F('order_products__quantity') * F('order_products__product__price'))
+class OrderQuerySet(models.QuerySet):
+    def with_calculated_total_cost(self):
+        return self.annotate(
+            calculated_total_cost=Coalesce(
+                Sum(F('order_products__quantity') * F('order_products__price')),
+                Value(0),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            )
         )
 
 
@@ -155,6 +213,7 @@ MANAGER_REVIEW = 'подтверждение менеджером'
 RESTAURANT_PROCESSING = 'обработка рестораном'
 COURIER_DELIVERY = 'доставка курьером'
 COMPLETED = 'завершен'
+UNPROCESSED_STATUSES = [NEW, MANAGER_REVIEW, RESTAURANT_PROCESSING, COURIER_DELIVERY]
 
 ONLINE_PAYMENT = 'электронно'
 CASH_PAYMENT = 'наличными'
@@ -198,6 +257,11 @@ class Order(models.Model):
         null=True,
         verbose_name='дата доставки',
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='дата изменения',
+    )
     firstname = models.CharField(verbose_name='имя', max_length=50)
 
     lastname = models.CharField(verbose_name='фамилия', max_length=50)
@@ -233,18 +297,36 @@ class Order(models.Model):
         blank=True,
         verbose_name='назначенный ресторан',
     )
-    objects = OrderManager()
+    total_cost = models.DecimalField(
+        'сумма заказа',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0)]
+    )
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
         indexes = [
-            models.Index(fields=['firstname', 'lastname'])
+            models.Index(fields=['firstname', 'lastname']),
+            models.Index(fields=['status', 'order_date'], name='status_order_date_idx'),
         ]
 
     def __str__(self):
         return f"{self.firstname} {self.lastname}"
 
+    def update_total_cost(self):
+        self.total_cost = self.order_products.aggregate(
+            total_cost=Coalesce(
+                Sum(F('quantity') * F('price')),
+                Value(0),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            )
+        )['total_cost']
+        self.save(update_fields=['total_cost', 'updated_at'])
+
 
 class OrderProduct(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_products')
@@ -262,3 +344,134 @@ class OrderProduct(models.Model):
 
     class Meta:
         unique_together = ('order', 'product')
+
+
+class OrderRestaurantCandidate(models.Model):
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='restaurant_candidates',
+        verbose_name='заказ',
+    )
+    restaurant = models.ForeignKey(
+        Restaurant,
+        on_delete=models.CASCADE,
+        related_name='order_candidates',
+        verbose_name='ресторан',
+    )
+    distance = models.FloatField(
+        'расстояние, км',
+        null=True,
+        blank=True,
+    )
+    can_prepare = models.BooleanField(
+        'может приготовить весь заказ',
+        default=False,
+    )
+
+    class Meta:
+        verbose_name = 'ресторан для заказа'
+        verbose_name_plural = 'рестораны для заказов'
+        unique_together = ('order', 'restaurant')
+        indexes = [
+            models.Index(fields=['order', 'can_prepare', 'distance'], name='candidate_order_distance_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.order} - {self.restaurant}"
+
+
+GEOCODING_PENDING = 'в очереди'
+GEOCODING_DONE = 'выполнено'
+GEOCODING_FAILED = 'ошибка'
+
+
+class GeocodingTask(models.Model):
+    STATUS_CHOICES = [
+        (GEOCODING_PENDING, GEOCODING_PENDING),
+        (GEOCODING_DONE, GEOCODING_DONE),
+        (GEOCODING_FAILED, GEOCODING_FAILED),
+    ]
+    order = models.OneToOneField(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='geocoding_task',
+        verbose_name='заказ',
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=GEOCODING_PENDING,
+        db_index=True,
+        verbose_name='статус',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        'попыток',
+        default=0,
+    )
+    created_at = models.DateTimeField(
+        'дата создания',
+        default=timezone.now,
+    )
+    processed_at = models.DateTimeField(
+        'дата обработки',
+        null=True,
+        blank=True,
+    )
+    next_attempt_at = models.DateTimeField(
+        'следующая попытка',
+        default=timezone.now,
+        db_index=True,
+        help_text='раньше этого времени задача из очереди не берётся',
+    )
+    error = models.TextField(
+        'ошибка',
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'задача геокодирования'
+        verbose_name_plural = 'задачи геокодирования'
+
+    def __str__(self):
+        return f"{self.order} - {self.status}"
+
+
+class GeocodeCache(models.Model):
+    address = models.CharField(
+        'нормализованный адрес',
+        max_length=200,
+        unique=True,
+    )
+    latitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        verbose_name="широта"
+    )
+    longitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        verbose_name="долгота"
+    )
+    fetched_at = models.DateTimeField(
+        'дата запроса к геокодеру',
+        default=timezone.now,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'кэш геокодера'
+        verbose_name_plural = 'кэш геокодера'
+
+    def __str__(self):
+        return self.address
+
+    @property
+    def coordinates(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.longitude, self.latitude
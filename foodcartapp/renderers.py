@@ -0,0 +1,40 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+django_json_encoder = DjangoJSONEncoder()
+
+
+def dumps(data):
+    if orjson and settings.JSON_BACKEND == 'orjson':
+        return orjson.dumps(data, default=django_json_encoder.default)
+    return json.dumps(
+        data,
+        cls=DjangoJSONEncoder,
+        ensure_ascii=False,
+        separators=(',', ':'),
+    ).encode()
+
+
+class FastJSONResponse(HttpResponse):
+    def __init__(self, data=None, content=None, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        if content is None:
+            content = dumps(data)
+        super().__init__(content=content, **kwargs)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
@@ -1,12 +1,14 @@
+from collections import defaultdict
+
 from django.db import transaction
 from rest_framework import serializers
 
-from .models import Order, Product, OrderProduct
-from .utils import fetch_coordinates
+from .models import GeocodingTask, Order, Product, OrderProduct
+from .utils import get_cached_coordinates
 
 
 class OrderProductSerializer(serializers.ModelSerializer):
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), required=True)
+    product = serializers.IntegerField(source='product_id', required=True)
     quantity = serializers.IntegerField(min_value=1)
     price = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
 
@@ -21,29 +23,71 @@ class OrderSerializer(serializers.ModelSerializer):
     phonenumber = serializers.CharField(required=True)
     address = serializers.CharField(required=True)
     products = OrderProductSerializer(many=True, source='order_products', required=True)
-    total_cost = serializers.DecimalField(max_digits=8, decimal_places=2, read_only=True)
+    total_cost = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = Order
         fields = ('id', 'firstname', 'lastname', 'phonenumber', 'address', 'products', 'total_cost')
         read_only_fields = ('total_cost',)
 
+    def validate_products(self, order_products):
+        product_ids = {order_product['product_id'] for order_product in order_products}
+        products = Product.objects.in_bulk(product_ids)
+        if product_ids - products.keys():
+            # ошибки по позициям в том же виде, что отдавал PrimaryKeyRelatedField
+            raise serializers.ValidationError([
+                {} if order_product['product_id'] in products else {
+                    'product': [f'Недопустимый первичный ключ "{order_product["product_id"]}" - объект не существует.'],
+                }
+                for order_product in order_products
+            ])
+
+        quantities = defaultdict(int)
+        for order_product in order_products:
+            quantities[order_product['product_id']] += order_product['quantity']
+        return [
+            {'product': products[product_id], 'quantity': quantity}
+            for product_id, quantity in quantities.items()
+        ]
+
+    def validate(self, attrs):
+        # кэш геокодера читаем до транзакции: в SQLite транзакция, начатая с чтения,
+        # не может потом взять блокировку на запись, если её уже держит соседний запрос
+        attrs['cached_coordinates'] = get_cached_coordinates(attrs['address'])
+        return attrs
+
     @transaction.atomic
     def create(self, validated_data):
         order_products = validated_data.pop('order_products')
-        order_coordinates = fetch_coordinates(validated_data['address'])
-        if order_coordinates:
-            longitude, latitude = order_coordinates
+        cached_coordinates = validated_data.pop('cached_coordinates', None)
+        validated_data['total_cost'] = sum(
+            order_product['product'].price * order_product['quantity']
+            for order_product in order_products
+        )
+        if 'coordinates' in validated_data:
+            # адрес уже геокодирован тем, кто сохраняет заказ
+            coordinates = validated_data.pop('coordinates')
+            needs_geocoding = False
+        else:
+            coordinates = cached_coordinates.coordinates if cached_coordinates else None
+            needs_geocoding = not cached_coordinates
+
+        if coordinates:
+            longitude, latitude = coordinates
             order = Order.objects.create(latitude=latitude, longitude=longitude, **validated_data)
         else:
             order = Order.objects.create(**validated_data)
 
-        for order_product in order_products:
-            product = order_product['product']
-            OrderProduct.objects.create(
+        if needs_geocoding:
+            GeocodingTask.objects.create(order=order)
+
+        OrderProduct.objects.bulk_create([
+            OrderProduct(
                 order=order,
-                product=product,
-                price=product.price,
-                quantity=order_product['quantity']
+                product=order_product['product'],
+                price=order_product['product'].price,
+                quantity=order_product['quantity'],
             )
+            for order_product in order_products
+        ])
         return order
@@ -0,0 +1,61 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import BANNERS_NAMESPACE, CATALOG_NAMESPACE, MENU_NAMESPACE, RESTAURANTS_NAMESPACE, bump_version
+from .candidates import refresh_candidates, refresh_menu_item_candidates
+from .models import Banner, Order, OrderProduct, Product, ProductCategory, Restaurant, RestaurantMenuItem
+
+# поля заказа, от которых зависят рестораны-кандидаты
+ORDER_CANDIDATE_FIELDS = {'latitude', 'longitude', 'status'}
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def on_restaurant_change(sender, **kwargs):
+    # версия меняется после коммита, иначе параллельный запрос успеет
+    # закэшировать под новой версией ещё старые данные
+    transaction.on_commit(partial(bump_version, RESTAURANTS_NAMESPACE))
+    transaction.on_commit(partial(bump_version, MENU_NAMESPACE))
+
+
+@receiver([post_save, post_delete], sender=Banner)
+def on_banner_change(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, BANNERS_NAMESPACE))
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductCategory)
+@receiver([post_save, post_delete], sender=RestaurantMenuItem)
+def on_catalog_change(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, CATALOG_NAMESPACE))
+
+
+@receiver([post_save, post_delete], sender=RestaurantMenuItem)
+def on_menu_change(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, MENU_NAMESPACE))
+
+
+@receiver(post_save, sender=Order)
+def on_order_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not ORDER_CANDIDATE_FIELDS & set(update_fields):
+        return
+    # после коммита позиции нового заказа уже записаны
+    transaction.on_commit(partial(refresh_candidates, order_ids=[instance.id], touch_orders=True))
+
+
+@receiver([post_save, post_delete], sender=OrderProduct)
+def on_order_product_change(sender, instance, **kwargs):
+    transaction.on_commit(partial(refresh_candidates, order_ids=[instance.order_id], touch_orders=True))
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def on_restaurant_save(sender, instance, **kwargs):
+    # версия ресторанов к этому моменту уже сменится, и индекс перестроится по свежим данным
+    transaction.on_commit(refresh_candidates)
+
+
+@receiver([post_save, post_delete], sender=RestaurantMenuItem)
+def on_menu_item_change(sender, instance, **kwargs):
+    transaction.on_commit(partial(refresh_menu_item_candidates, instance.product_id))
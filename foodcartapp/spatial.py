@@ -0,0 +1,128 @@
+from collections import defaultdict
+from math import cos, floor, radians
+
+import numpy as np
+from django.conf import settings
+
+from . import utils
+from .cache import RESTAURANTS_NAMESPACE, get_version
+
+
+KM_PER_DEGREE = 111.195
+# параллель длиннее дуги большого круга, поэтому оценка расстояния до
+# непросмотренных ячеек берётся с запасом
+DISTANCE_BOUND_MARGIN = 0.95
+
+_index = None
+
+
+class RestaurantIndex:
+    def __init__(self, restaurants, cell_size, version=None):
+        self.cell_size = cell_size
+        self.version = version
+        self.restaurants = [
+            restaurant for restaurant in restaurants
+            if restaurant.latitude is not None and restaurant.longitude is not None
+        ]
+        self.positions_by_id = {
+            restaurant.id: position for position, restaurant in enumerate(self.restaurants)
+        }
+        self.coordinates = np.array(
+            [(restaurant.latitude, restaurant.longitude) for restaurant in self.restaurants],
+            dtype=float,
+        ).reshape(-1, 2)
+        self.cells = defaultdict(list)
+        for position, (latitude, longitude) in enumerate(self.coordinates):
+            self.cells[self.get_cell(latitude, longitude)].append(position)
+
+    def get_cell(self, latitude, longitude):
+        return floor(float(latitude) / self.cell_size), floor(float(longitude) / self.cell_size)
+
+    def iter_rings(self, latitude, longitude):
+        center_lat, center_lon = self.get_cell(latitude, longitude)
+        ring = 0
+        visited_cells = 0
+        while visited_cells < len(self.cells):
+            if 8 * ring > len(self.cells):
+                # кольцо стало больше, чем занятых ячеек: дешевле разложить оставшиеся ячейки по кольцам
+                remaining = defaultdict(list)
+                for (lat_cell, lon_cell), positions in self.cells.items():
+                    cell_ring = max(abs(lat_cell - center_lat), abs(lon_cell - center_lon))
+                    if cell_ring >= ring:
+                        remaining[cell_ring].extend(positions)
+                for cell_ring in sorted(remaining):
+                    yield cell_ring, remaining[cell_ring]
+                return
+
+            positions = []
+            for lat_cell in range(center_lat - ring, center_lat + ring + 1):
+                for lon_cell in range(center_lon - ring, center_lon + ring + 1):
+                    is_on_ring = max(abs(lat_cell - center_lat), abs(lon_cell - center_lon)) == ring
+                    if is_on_ring and (lat_cell, lon_cell) in self.cells:
+                        visited_cells += 1
+                        positions.extend(self.cells[lat_cell, lon_cell])
+            yield ring, positions
+            ring += 1
+
+    def get_ring_bound(self, latitude, ring):
+        # всё, что лежит за пределами колец 0..ring, не ближе этого расстояния
+        farthest_latitude = min(abs(float(latitude)) + (ring + 1) * self.cell_size, 89.9)
+        return ring * self.cell_size * KM_PER_DEGREE * cos(radians(farthest_latitude)) * DISTANCE_BOUND_MARGIN
+
+    def measure(self, latitude, longitude, positions):
+        positions = list(positions)
+        distances = utils.calculate_distance_matrix([(latitude, longitude)], self.coordinates[positions])[0]
+        return sorted(zip(distances, positions))
+
+    def nearest(self, latitude, longitude, limit=None, restaurant_ids=None):
+        allowed = self.get_allowed_positions(restaurant_ids)
+        if limit is None or limit >= len(allowed):
+            return self.to_restaurants(self.measure(latitude, longitude, allowed))
+
+        found = []
+        for ring, positions in self.iter_rings(latitude, longitude):
+            positions = [position for position in positions if position in allowed]
+            if positions:
+                found = sorted(found + self.measure(latitude, longitude, positions))
+            if len(found) >= limit and found[limit - 1][0] <= self.get_ring_bound(latitude, ring):
+                break
+        return self.to_restaurants(found[:limit])
+
+    def within_radius(self, latitude, longitude, radius, restaurant_ids=None):
+        allowed = self.get_allowed_positions(restaurant_ids)
+        found = []
+        for ring, positions in self.iter_rings(latitude, longitude):
+            if self.get_ring_bound(latitude, ring - 1) > radius:
+                break
+            positions = [position for position in positions if position in allowed]
+            found.extend(
+                (distance, position)
+                for distance, position in self.measure(latitude, longitude, positions)
+                if distance <= radius
+            )
+        return self.to_restaurants(sorted(found))
+
+    def get_allowed_positions(self, restaurant_ids):
+        if restaurant_ids is None:
+            return set(range(len(self.restaurants)))
+        return {
+            self.positions_by_id[restaurant_id]
+            for restaurant_id in restaurant_ids
+            if restaurant_id in self.positions_by_id
+        }
+
+    def to_restaurants(self, found):
+        return [(self.restaurants[position], float(distance)) for distance, position in found]
+
+
+def get_restaurant_index():
+    global _index
+
+    version = get_version(RESTAURANTS_NAMESPACE)
+    if _index is None or _index.version != version:
+        _index = RestaurantIndex(
+            utils.get_restaurants(),
+            cell_size=settings.RESTAURANT_INDEX_CELL_SIZE,
+            version=version,
+        )
+    return _index
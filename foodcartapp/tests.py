@@ -0,0 +1,599 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from itertools import permutations
+from math import atan2, cos, radians, sin, sqrt
+from unittest import mock
+
+import httpx
+import numpy as np
+import requests
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import utils
+from .assignment import solve_assignment
+from .candidates import refresh_candidates
+from .datagen import generate_dataset
+from .gazetteer import Gazetteer
+from .geocoder import CircuitBreaker, CircuitOpen, GeocoderUnavailable, YandexGeocoder, normalize_address
+from .models import Banner, GeocodeCache, GeocodingTask, Order, OrderProduct, OrderRestaurantCandidate, Product, Restaurant
+from .models import GEOCODING_DONE, GEOCODING_PENDING
+from .spatial import RestaurantIndex
+from .views import get_banners_content
+from .utils import calculate_distance, calculate_distance_matrix, claim_geocoding_tasks, geocode_pending_orders
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductListApiQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate_dataset()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cold_cache(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('foodcartapp:product_list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_warm_cache(self):
+        self.client.get(reverse('foodcartapp:product_list'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('foodcartapp:product_list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified(self):
+        etag = self.client.get(reverse('foodcartapp:product_list'))['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('foodcartapp:product_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BannersContentTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        # миграция 0061 уже добавила баннеры из assets
+        Banner.objects.all().delete()
+
+    def get_titles(self, now):
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            return [banner['title'] for banner in json.loads(get_banners_content())]
+
+    def test_rebuilds_when_banner_schedule_changes(self):
+        now = timezone.now()
+        Banner.objects.create(title='Всегда', image='always.jpg', position=0)
+        Banner.objects.create(
+            title='Акция', image='sale.jpg', position=1,
+            active_from=now + timedelta(hours=1), active_until=now + timedelta(hours=2),
+        )
+
+        self.assertEqual(self.get_titles(now), ['Всегда'])
+        # баннеры не менялись, и кэш пересобирается только по expires_at
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_titles(now + timedelta(minutes=59)), ['Всегда'])
+        self.assertEqual(self.get_titles(now + timedelta(hours=1)), ['Всегда', 'Акция'])
+        self.assertEqual(self.get_titles(now + timedelta(hours=2)), ['Всегда'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderCreateApiQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = generate_dataset()
+
+    def setUp(self):
+        cache.clear()
+
+    def create_order(self, products_count, address='Москва, Красная площадь, 1'):
+        payload = {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79261234567',
+            'address': address,
+            'products': [
+                {'product': product.id, 'quantity': 2}
+                for product in self.dataset.products[:products_count]
+            ],
+        }
+        # сигналы пересчитывают рестораны-кандидаты после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('foodcartapp:order_create'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_cold_cache(self):
+        with self.assertNumQueries(17):
+            self.create_order(products_count=1)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        # первый заказ прогревает кэш ресторанов
+        self.create_order(products_count=1)
+        for products_count in (1, 5, 20):
+            with self.subTest(products_count=products_count), self.assertNumQueries(16):
+                self.create_order(products_count=products_count)
+
+    def test_geocoded_address(self):
+        address = 'Москва, Тверская улица, 1'
+        GeocodeCache.objects.create(address=normalize_address(address), latitude='55.757', longitude='37.614')
+        # для адреса из кэша геокодера задача на геокодирование не создаётся
+        with self.assertNumQueries(16):
+            response = self.create_order(products_count=5, address=address)
+        order = Order.objects.get(id=response.json()['id'])
+        self.assertIsNotNone(order.latitude)
+
+
+class OrderCreateValidationTest(TestCase):
+    def test_unknown_product_error_per_line(self):
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        payload = {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79261234567',
+            'address': 'Москва, Красная площадь, 1',
+            'products': [{'product': product.id, 'quantity': 1}, {'product': product.id + 1, 'quantity': 1}],
+        }
+        response = self.client.post(reverse('foodcartapp:order_create'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'products': [
+            {},
+            {'product': [f'Недопустимый первичный ключ "{product.id + 1}" - объект не существует.']},
+        ]})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderCreateAsyncTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Чизбургер', price=Decimal('150.00'))
+
+    def setUp(self):
+        cache.clear()
+        self.geocoder = mock.Mock()
+        patcher = mock.patch('foodcartapp.views.get_geocoder', return_value=self.geocoder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, data, content_type='application/json'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('foodcartapp:order_create_async'), data, content_type=content_type)
+
+    def get_payload(self):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79261234567',
+            'address': 'Москва, Арбат, 1',
+            'products': [{'product': self.product.id, 'quantity': 2}],
+        }
+
+    def test_valid_order(self):
+        self.geocoder.afetch_coordinates = mock.AsyncMock(return_value=('37.59', '55.75'))
+        response = self.post(self.get_payload())
+        self.assertEqual(response.status_code, 200, response.content)
+
+        order = Order.objects.get(id=response.json()['id'])
+        self.assertEqual(order.total_cost, Decimal('300.00'))
+        self.assertEqual(order.latitude, Decimal('55.75'))
+        self.assertFalse(GeocodingTask.objects.filter(order=order).exists())
+        self.assertTrue(GeocodeCache.objects.filter(address=normalize_address('Москва, Арбат, 1')).exists())
+
+    def test_geocoder_failure_queues_task(self):
+        self.geocoder.afetch_coordinates = mock.AsyncMock(side_effect=GeocoderUnavailable('не отвечает'))
+        response = self.post(self.get_payload())
+        self.assertEqual(response.status_code, 200, response.content)
+
+        order = Order.objects.get(id=response.json()['id'])
+        self.assertIsNone(order.latitude)
+        self.assertEqual(GeocodingTask.objects.get(order=order).status, GEOCODING_PENDING)
+
+    def test_invalid_json(self):
+        response = self.post('{"products": [', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_get_not_allowed(self):
+        response = self.client.get(reverse('foodcartapp:order_create_async'))
+        self.assertEqual(response.status_code, 405)
+
+
+@mock.patch('foodcartapp.geocoder.time.monotonic', return_value=0)
+class YandexGeocoderResponseTest(SimpleTestCase):
+    def setUp(self):
+        self.circuit_breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        self.geocoder = YandexGeocoder(
+            base_url='https://geocode-maps.yandex.ru/1.x', api_key='key', connect_timeout=1, read_timeout=1,
+            pool_size=1, retries=0, retry_backoff=0, circuit_breaker=self.circuit_breaker, metrics=mock.Mock(),
+        )
+
+    def fetch_async(self, response):
+        client = mock.Mock(get=mock.AsyncMock(return_value=response))
+        with mock.patch.object(self.geocoder, 'get_async_client', mock.AsyncMock(return_value=client)):
+            return async_to_sync(self.geocoder.afetch_coordinates)('Москва, Арбат, 1')
+
+    def fetch_sync(self, response):
+        with mock.patch.object(self.geocoder.session, 'get', return_value=response):
+            return self.geocoder.fetch_coordinates('Москва, Арбат, 1')
+
+    def test_malformed_response(self, monotonic):
+        request = httpx.Request('GET', 'https://geocode-maps.yandex.ru/1.x')
+        responses = [
+            httpx.Response(200, content=b'<html>', request=request),
+            httpx.Response(200, json={'statusCode': 403}, request=request),
+        ]
+        for fetch in (self.fetch_async, self.fetch_sync):
+            for response in responses:
+                # у ответов httpx и requests одинаковые json() и raise_for_status()
+                with self.subTest(fetch=fetch.__name__, content=response.content):
+                    with self.assertRaises(GeocoderUnavailable):
+                        fetch(response)
+        self.assertEqual(self.circuit_breaker.failures, 4)
+
+    def test_found_address(self, monotonic):
+        request = httpx.Request('GET', 'https://geocode-maps.yandex.ru/1.x')
+        response = httpx.Response(200, request=request, json={'response': {'GeoObjectCollection': {
+            'featureMember': [{'GeoObject': {'Point': {'pos': '37.59 55.75'}}}],
+        }}})
+        self.assertEqual(self.fetch_async(response), ('37.59', '55.75'))
+
+
+class OrderTotalCostTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        burger = Product.objects.create(name='Чизбургер', price=Decimal('150.00'))
+        fries = Product.objects.create(name='Картофель фри', price=Decimal('99.50'))
+        cls.order = Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber='+79261234567', address='Москва, Арбат, 1',
+        )
+        OrderProduct.objects.bulk_create([
+            OrderProduct(order=cls.order, product=burger, price=burger.price, quantity=2),
+            OrderProduct(order=cls.order, product=fries, price=fries.price, quantity=1),
+        ])
+        cls.empty_order = Order.objects.create(
+            firstname='Пётр', lastname='Иванов', phonenumber='+79261234568', address='Москва, Арбат, 2',
+        )
+
+    def test_update_total_cost(self):
+        self.order.update_total_cost()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_cost, Decimal('399.50'))
+
+    def test_update_total_cost_without_products(self):
+        Order.objects.filter(id=self.empty_order.id).update(total_cost=Decimal('100'))
+        self.empty_order.refresh_from_db()
+        self.empty_order.update_total_cost()
+        self.empty_order.refresh_from_db()
+        self.assertEqual(self.empty_order.total_cost, 0)
+
+    def test_verify_reports_mismatch(self):
+        stdout = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('update_order_totals', verify=True, stdout=stdout)
+        self.assertIn(f'Заказ {self.order.id}', stdout.getvalue())
+        # проверка ничего не меняет
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_cost, 0)
+
+    def test_update_order_totals(self):
+        stdout = StringIO()
+        call_command('update_order_totals', batch_size=1, stdout=stdout)
+        self.assertIn('Обновлено заказов: 1', stdout.getvalue())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_cost, Decimal('399.50'))
+
+        stdout = StringIO()
+        call_command('update_order_totals', verify=True, stdout=stdout)
+        self.assertIn('Суммы всех заказов совпадают', stdout.getvalue())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GeocodePendingOrdersTest(TestCase):
+    def setUp(self):
+        # версии кэша в TestCase не сбрасываются после коммита, индекс ресторанов остался бы от других тестов
+        cache.clear()
+        order = Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber='+79261234567', address='Москва, Арбат, 1',
+        )
+        self.task = GeocodingTask.objects.create(order=order)
+
+    @mock.patch('foodcartapp.utils.fetch_coordinates', side_effect=requests.ConnectionError)
+    def test_failed_task_waits_before_next_attempt(self, fetch_coordinates):
+        self.assertEqual(geocode_pending_orders(batch_size=10, max_attempts=5), (1, 1))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, GEOCODING_PENDING)
+        self.assertEqual(self.task.attempts, 1)
+        self.assertGreater(self.task.next_attempt_at, timezone.now())
+
+        # до следующей попытки задача из очереди не берётся
+        self.assertEqual(geocode_pending_orders(batch_size=10, max_attempts=5), (0, 0))
+        self.assertEqual(fetch_coordinates.call_count, 1)
+
+    @mock.patch('foodcartapp.utils.fetch_coordinates', side_effect=requests.ConnectionError)
+    def test_retry_delay_grows(self, fetch_coordinates):
+        delays = []
+        for _ in range(3):
+            GeocodingTask.objects.filter(id=self.task.id).update(next_attempt_at=timezone.now())
+            started_at = timezone.now()
+            geocode_pending_orders(batch_size=10, max_attempts=5)
+            self.task.refresh_from_db()
+            delays.append(self.task.next_attempt_at - started_at)
+        self.assertLess(delays[0], delays[1])
+        self.assertLess(delays[1], delays[2])
+
+    @mock.patch('foodcartapp.utils.fetch_coordinates', side_effect=CircuitOpen('не отвечает', retry_after=30))
+    def test_open_circuit_does_not_use_attempts(self, fetch_coordinates):
+        started_at = timezone.now()
+        self.assertEqual(geocode_pending_orders(batch_size=10, max_attempts=1), (1, 1))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, GEOCODING_PENDING)
+        self.assertEqual(self.task.attempts, 0)
+        self.assertGreaterEqual(self.task.next_attempt_at, started_at + timedelta(seconds=30))
+
+    def test_claimed_task_is_leased(self):
+        self.assertEqual(claim_geocoding_tasks(batch_size=10), [self.task])
+        # пока первый обработчик ждёт геокодер, второй эту задачу не получит
+        self.assertEqual(claim_geocoding_tasks(batch_size=10), [])
+
+        GeocodingTask.objects.filter(id=self.task.id).update(next_attempt_at=timezone.now())
+        self.assertEqual(claim_geocoding_tasks(batch_size=10), [self.task])
+
+    @mock.patch('foodcartapp.utils.fetch_coordinates', return_value=(37.59, 55.75))
+    def test_geocoded_task(self, fetch_coordinates):
+        self.assertEqual(geocode_pending_orders(batch_size=10, max_attempts=5), (1, 0))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, GEOCODING_DONE)
+        self.assertIsNotNone(self.task.order.latitude)
+
+
+@override_settings(GEOCODE_CACHE_TTL=60 * 60, GEOCODE_CACHE_NOT_FOUND_TTL=60, GEOCODE_CACHE_MAX_ENTRIES=3)
+class GeocodeCacheTest(TestCase):
+    def cache_address(self, address, coordinates, age):
+        longitude, latitude = coordinates or (None, None)
+        GeocodeCache.objects.create(
+            address=normalize_address(address), latitude=latitude, longitude=longitude,
+            fetched_at=timezone.now() - age,
+        )
+
+    @mock.patch('foodcartapp.utils.fetch_coordinates', return_value=('37.59', '55.75'))
+    def test_fresh_entry_is_used(self, fetch_coordinates):
+        self.cache_address('Москва, Арбат, 1', ('37.5', '55.7'), age=timedelta(minutes=59))
+        self.assertEqual(utils.get_coordinates('Москва,  арбат, 1'), (Decimal('37.5'), Decimal('55.7')))
+        fetch_coordinates.assert_not_called()
+
+    @mock.patch('foodcartapp.utils.fetch_coordinates', return_value=('37.59', '55.75'))
+    def test_expired_entry_is_refetched(self, fetch_coordinates):
+        self.cache_address('Москва, Арбат, 1', ('37.5', '55.7'), age=timedelta(minutes=61))
+        self.assertEqual(utils.get_coordinates('Москва, Арбат, 1'), ('37.59', '55.75'))
+        fetch_coordinates.assert_called_once()
+
+        cached = GeocodeCache.objects.get(address=normalize_address('Москва, Арбат, 1'))
+        self.assertEqual(cached.latitude, Decimal('55.75'))
+        self.assertTrue(utils.is_geocode_cache_fresh(cached))
+
+    def test_not_found_entry_expires_sooner(self):
+        self.cache_address('Москва, Арбат, 1', ('37.5', '55.7'), age=timedelta(minutes=2))
+        self.cache_address('Нигде, 1', None, age=timedelta(minutes=2))
+        self.cache_address('Нигде, 2', None, age=timedelta(seconds=30))
+
+        fresh = [
+            cached.address for cached in GeocodeCache.objects.order_by('address')
+            if utils.is_geocode_cache_fresh(cached)
+        ]
+        self.assertEqual(fresh, [normalize_address('Москва, Арбат, 1'), normalize_address('Нигде, 2')])
+
+    @mock.patch('foodcartapp.utils.fetch_coordinates', return_value=None)
+    def test_not_found_address_is_cached(self, fetch_coordinates):
+        self.assertIsNone(utils.get_coordinates('Нигде, 1'))
+        self.assertIsNone(utils.get_coordinates('Нигде, 1'))
+        fetch_coordinates.assert_called_once()
+
+    def test_eviction_keeps_newest_entries(self):
+        for minutes in range(1, 4):
+            self.cache_address(f'Москва, Арбат, {minutes}', ('37.5', '55.7'), age=timedelta(minutes=minutes))
+        self.cache_address('Москва, Арбат, 100', ('37.5', '55.7'), age=timedelta(hours=2))
+
+        utils.save_cached_coordinates('Москва, Тверская, 1', ('37.6', '55.76'))
+        self.assertEqual(
+            sorted(GeocodeCache.objects.values_list('address', flat=True)),
+            sorted(normalize_address(address) for address in [
+                'Москва, Тверская, 1', 'Москва, Арбат, 1', 'Москва, Арбат, 2',
+            ]),
+        )
+
+    def test_bulk_save_evicts_overflow(self):
+        utils.save_cached_coordinates_bulk({f'Москва, Арбат, {number}': ('37.5', '55.7') for number in range(5)})
+        self.assertEqual(GeocodeCache.objects.count(), 3)
+
+
+class GazetteerLookupTest(SimpleTestCase):
+    def setUp(self):
+        self.gazetteer = Gazetteer([
+            ('Москва, Тверская улица, 1', '55.757', '37.614'),
+            ('Москва, Тверская улица, 10', '55.765', '37.605'),
+            ('Москва, Арбат, 20', '55.750', '37.593'),
+        ])
+
+    def test_exact_match(self):
+        self.assertEqual(self.gazetteer.lookup('москва  тверская улица,  10'), ('37.605', '55.765'))
+
+    def test_apartment_suffix(self):
+        self.assertEqual(self.gazetteer.lookup('Москва, Тверская улица, 1, кв. 5'), ('37.614', '55.757'))
+
+    def test_no_match(self):
+        self.assertIsNone(self.gazetteer.lookup('Москва, Арбат, 2'))
+
+    def test_house_number_is_not_completed(self):
+        gazetteer = Gazetteer([('Москва, Тверская улица, 10', '55.76', '37.61')])
+        self.assertIsNone(gazetteer.lookup('Москва, Тверская улица, 1'))
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    sin_half_dist_sqr = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * atan2(sqrt(sin_half_dist_sqr), sqrt(1 - sin_half_dist_sqr))
+
+
+class DistanceMatrixTest(SimpleTestCase):
+    origins = [(55.7558, 37.6173), (59.9386, 30.3141), (55.7558, 37.6173)]
+    destinations = [(55.7522, 37.6156), (43.1155, 131.8855)]
+
+    def test_matches_pairwise_distances(self):
+        matrix = calculate_distance_matrix(self.origins, self.destinations)
+        self.assertEqual(matrix.shape, (3, 2))
+        for origin, row in zip(self.origins, matrix):
+            for destination, distance in zip(self.destinations, row):
+                self.assertAlmostEqual(distance, haversine(*origin, *destination), places=6)
+
+    def test_same_point(self):
+        self.assertEqual(calculate_distance(55.7558, 37.6173, 55.7558, 37.6173), 0)
+
+    def test_decimal_coordinates(self):
+        # координаты в моделях хранятся в DecimalField
+        distance = calculate_distance(Decimal('55.7558'), Decimal('37.6173'), Decimal('59.9386'), Decimal('30.3141'))
+        self.assertAlmostEqual(distance, haversine(55.7558, 37.6173, 59.9386, 30.3141), places=6)
+
+
+@mock.patch('foodcartapp.geocoder.time.monotonic')
+class CircuitBreakerTest(SimpleTestCase):
+    def open_breaker(self, monotonic):
+        monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+        for _ in range(3):
+            self.assertTrue(breaker.allow_request())
+            breaker.record_failure()
+        return breaker
+
+    def test_opens_after_threshold(self, monotonic):
+        breaker = self.open_breaker(monotonic)
+        self.assertTrue(breaker.is_open)
+        monotonic.return_value = 110
+        self.assertFalse(breaker.allow_request())
+        self.assertEqual(breaker.retry_after(), 20)
+
+    def test_success_resets_failures(self, monotonic):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+
+    def test_single_probe_after_timeout(self, monotonic):
+        breaker = self.open_breaker(monotonic)
+        monotonic.return_value = 131
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+
+    def test_successful_probe_closes(self, monotonic):
+        breaker = self.open_breaker(monotonic)
+        monotonic.return_value = 131
+        breaker.allow_request()
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertEqual(breaker.retry_after(), 0)
+        self.assertTrue(breaker.allow_request())
+
+
+class SolveAssignmentTest(SimpleTestCase):
+    def assert_optimal(self, costs):
+        assignment = solve_assignment(costs)
+        rows_count, columns_count = costs.shape
+        self.assertEqual(len(set(assignment)), rows_count)
+        best_cost = min(
+            costs[range(rows_count), columns].sum()
+            for columns in permutations(range(columns_count), rows_count)
+        )
+        self.assertAlmostEqual(costs[range(rows_count), assignment].sum(), best_cost)
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        for rows_count, columns_count in [(1, 1), (3, 3), (4, 6), (5, 5), (2, 7)]:
+            for _ in range(10):
+                with self.subTest(shape=(rows_count, columns_count)):
+                    self.assert_optimal(rng.uniform(0, 100, size=(rows_count, columns_count)))
+
+    def test_ties_and_forbidden_pairs(self):
+        # неподходящие рестораны в планировщике получают огромную стоимость
+        costs = np.array([[1e9, 5, 5], [1, 1e9, 5], [1, 1, 1e9]])
+        self.assert_optimal(costs)
+
+    def test_more_rows_than_columns(self):
+        with self.assertRaises(ValueError):
+            solve_assignment(np.zeros((3, 2)))
+
+
+class RestaurantIndexTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.restaurants = [
+            Restaurant(id=restaurant_id, latitude=latitude, longitude=longitude)
+            for restaurant_id, (latitude, longitude) in enumerate(
+                zip(rng.uniform(55.5, 56, 200), rng.uniform(37.3, 37.9, 200)), start=1,
+            )
+        ]
+        self.index = RestaurantIndex(self.restaurants, cell_size=0.05)
+        self.points = list(zip(rng.uniform(55.4, 56.1, 20), rng.uniform(37.2, 38, 20)))
+
+    def measure_all(self, latitude, longitude, restaurants=None):
+        return sorted(
+            (haversine(latitude, longitude, restaurant.latitude, restaurant.longitude), restaurant.id)
+            for restaurant in restaurants or self.restaurants
+        )
+
+    def test_nearest_matches_brute_force(self):
+        for latitude, longitude in self.points:
+            found = self.index.nearest(latitude, longitude, limit=10)
+            expected = self.measure_all(latitude, longitude)[:10]
+            self.assertEqual([restaurant.id for restaurant, _ in found], [id_ for _, id_ in expected])
+
+    def test_nearest_among_allowed(self):
+        allowed = self.restaurants[::7]
+        for latitude, longitude in self.points:
+            found = self.index.nearest(
+                latitude, longitude, limit=5, restaurant_ids={restaurant.id for restaurant in allowed},
+            )
+            expected = self.measure_all(latitude, longitude, allowed)[:5]
+            self.assertEqual([restaurant.id for restaurant, _ in found], [id_ for _, id_ in expected])
+
+    def test_within_radius_matches_brute_force(self):
+        for latitude, longitude in self.points:
+            found = self.index.within_radius(latitude, longitude, radius=7)
+            expected = [id_ for distance, id_ in self.measure_all(latitude, longitude) if distance <= 7]
+            self.assertEqual([restaurant.id for restaurant, _ in found], expected)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, NEAREST_RESTAURANTS_LIMIT=3)
+class CandidatesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = generate_dataset(orders_count=30, restaurants_count=20)
+
+    def test_stores_nearest_and_nearest_eligible(self):
+        cache.clear()
+        refresh_candidates()
+        restaurants = list(Restaurant.objects.all())
+        for order in Order.objects.exclude(latitude=None):
+            eligible_ids = {
+                restaurant.id
+                for restaurant in utils.get_eligible_restaurants_by_order([order]).get(order.id, ())
+            }
+            distances = sorted(
+                (haversine(order.latitude, order.longitude, restaurant.latitude, restaurant.longitude), restaurant.id)
+                for restaurant in restaurants
+            )
+            expected = {id_ for _, id_ in distances[:3]}
+            expected |= {id_ for _, id_ in [pair for pair in distances if pair[1] in eligible_ids][:3]}
+            stored = OrderRestaurantCandidate.objects.filter(order=order)
+            self.assertEqual({candidate.restaurant_id for candidate in stored}, expected)
+            for candidate in stored:
+                self.assertEqual(candidate.can_prepare, candidate.restaurant_id in eligible_ids)
+
@@ -1,12 +1,13 @@
 from django.urls import path
 
-from .views import product_list_api, banners_list_api, OrderCreateView
+from .views import product_list_api, banners_list_api, order_create_async, OrderCreateView
 
 
 app_name = "foodcartapp"
 
 urlpatterns = [
-    path('products/', product_list_api),
-    path('banners/', banners_list_api),
+    path('products/', product_list_api, name='product_list'),
+    path('banners/', banners_list_api, name='banners_list'),
     path('order/', OrderCreateView.as_view(), name='order_create'),
+    path('order/async/', order_create_async, name='order_create_async'),
 ]
@@ -1,63 +1,283 @@
-from math import sin, cos, sqrt, atan2, radians
+from collections import defaultdict
+from datetime import timedelta
 
+import numpy as np
 import requests
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.utils import timezone
 
-from .models import Order, Restaurant, RestaurantMenuItem
+from . import candidates
+from .cache import MENU_NAMESPACE, RESTAURANTS_NAMESPACE, get_or_set_versioned, versioned_cache
+from .geocoder import CircuitOpen, get_geocoder, normalize_address
+from .models import GeocodeCache, GeocodingTask, Order, OrderProduct, Restaurant, RestaurantMenuItem
+from .models import GEOCODING_DONE, GEOCODING_FAILED, GEOCODING_PENDING
 
 
-def get_eligible_restaurants(order: Order):
-    eligible_restaurants = set()
-
-    for product in order.products.all():
-        restaurants_with_product = (
-            RestaurantMenuItem.objects
-            .filter(product=product, availability=True)
-            .select_related('restaurant')
-            .values_list('restaurant', flat=True)
+def get_eligible_restaurants_by_order(orders):
+    order_ids = [order.id for order in orders]
+    order_products_count = (
+        OrderProduct.objects
+        .filter(order=OuterRef('product__orderproduct__order'))
+        .values('order')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    eligible_pairs = list(
+        RestaurantMenuItem.objects
+        .filter(availability=True, product__orderproduct__order__in=order_ids)
+        .values('product__orderproduct__order', 'restaurant')
+        .annotate(
+            available_products_count=Count('product', distinct=True),
+            order_products_count=Subquery(order_products_count),
         )
-        restaurant_objects = Restaurant.objects.filter(id__in=restaurants_with_product)
+        .filter(available_products_count=F('order_products_count'))
+        .values_list('product__orderproduct__order', 'restaurant')
+    )
 
-        if not eligible_restaurants:
-            eligible_restaurants.update(restaurant_objects)
-        else:
-            eligible_restaurants.intersection_update(restaurant_objects)
+    restaurants = Restaurant.objects.in_bulk({restaurant_id for _, restaurant_id in eligible_pairs})
+    eligible_restaurants = defaultdict(set)
+    for order_id, restaurant_id in eligible_pairs:
+        eligible_restaurants[order_id].add(restaurants[restaurant_id])
+    return eligible_restaurants
 
-        if not eligible_restaurants:
-            break
 
-    return eligible_restaurants
+def get_eligible_restaurants(order: Order):
+    return get_eligible_restaurants_by_order([order])[order.id]
+
+
+@versioned_cache(RESTAURANTS_NAMESPACE, 'all')
+def get_restaurants():
+    return list(Restaurant.objects.order_by('name'))
+
+
+def get_menu_availability():
+    return get_or_set_versioned(
+        MENU_NAMESPACE,
+        ['availability'],
+        calculate_menu_availability,
+        settings.CATALOG_CACHE_TIMEOUT,
+    )
+
+
+def calculate_menu_availability():
+    restaurants = list(Restaurant.objects.order_by('name').values_list('id', 'name'))
+    columns = {restaurant_id: column for column, (restaurant_id, _) in enumerate(restaurants)}
+    # доступность товара во всех ресторанах упакована в биты одного числа
+    masks = defaultdict(int)
+    available_items = (
+        RestaurantMenuItem.objects
+        .filter(availability=True)
+        .values_list('product_id', 'restaurant_id')
+    )
+    for product_id, restaurant_id in available_items:
+        if restaurant_id in columns:
+            masks[product_id] |= 1 << columns[restaurant_id]
+
+    return {
+        'restaurants': restaurants,
+        'masks': dict(masks),
+    }
+
+
+def unpack_availability(mask, restaurants_count):
+    return [bool(mask >> column & 1) for column in range(restaurants_count)]
 
 
 def fetch_coordinates(address):
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    response = requests.get(base_url, params={
-        "geocode": address,
-        "apikey": settings.YANDEX_API_KEY,
-        "format": "json",
-    })
-    response.raise_for_status()
-    found_places = response.json()['response']['GeoObjectCollection']['featureMember']
-
-    if not found_places:
+    return get_geocoder().fetch_coordinates(address)
+
+
+def is_geocode_cache_fresh(cached):
+    # ненайденные адреса тоже кэшируются, но на меньший срок
+    ttl = settings.GEOCODE_CACHE_TTL if cached.coordinates else settings.GEOCODE_CACHE_NOT_FOUND_TTL
+    return cached.fetched_at >= timezone.now() - timedelta(seconds=ttl)
+
+
+def get_cached_coordinates(address):
+    cached = GeocodeCache.objects.filter(address=normalize_address(address)).first()
+    if not cached or not is_geocode_cache_fresh(cached):
         return None
+    return cached
 
-    most_relevant = found_places[0]
-    lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
-    return lon, lat
 
+def get_cached_coordinates_bulk(addresses):
+    addresses = {normalize_address(address) for address in addresses}
+    return {
+        cached.address: cached
+        for cached in GeocodeCache.objects.filter(address__in=addresses)
+        if is_geocode_cache_fresh(cached)
+    }
 
-def calculate_distance(lat1, lon1, lat2, lon2):
+
+def get_coordinates(address):
+    cached = get_cached_coordinates(address)
+    if cached:
+        return cached.coordinates
+
+    coordinates = fetch_coordinates(address)
+    save_cached_coordinates(address, coordinates)
+    return coordinates
+
+
+def save_cached_coordinates(address, coordinates):
+    longitude, latitude = coordinates or (None, None)
+    _, created = GeocodeCache.objects.update_or_create(
+        address=normalize_address(address),
+        defaults={'latitude': latitude, 'longitude': longitude, 'fetched_at': timezone.now()},
+    )
+    if created:
+        evict_geocode_cache()
+
+
+def save_cached_coordinates_bulk(coordinates_by_address):
+    now = timezone.now()
+    entries = {}
+    for address, coordinates in coordinates_by_address.items():
+        longitude, latitude = coordinates or (None, None)
+        address = normalize_address(address)
+        entries[address] = GeocodeCache(address=address, latitude=latitude, longitude=longitude, fetched_at=now)
+    GeocodeCache.objects.filter(address__in=entries).delete()
+    GeocodeCache.objects.bulk_create(entries.values())
+    evict_geocode_cache()
+
+
+def get_geocoding_retry_delay(attempts):
+    delay = settings.GEOCODING_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.GEOCODING_RETRY_MAX_DELAY))
+
+
+def claim_geocoding_tasks(batch_size):
+    # пока идут запросы к геокодеру, задачи не видны другим обработчикам.
+    # Если обработчик упадёт, задачи вернутся в очередь по истечении аренды
+    now = timezone.now()
+    leased_until = now + timedelta(seconds=settings.GEOCODING_LEASE)
+    pending_tasks = (
+        GeocodingTask.objects
+        .filter(status=GEOCODING_PENDING, next_attempt_at__lte=now)
+        .select_related('order')
+        .order_by('next_attempt_at')
+    )
+
+    if connection.features.has_select_for_update_skip_locked:
+        # блокируем только задачи: заказы в это время должны оставаться доступны админке и распределению
+        with transaction.atomic():
+            tasks = list(pending_tasks.select_for_update(skip_locked=True, of=('self',))[:batch_size])
+            GeocodingTask.objects.filter(id__in=[task.id for task in tasks]).update(next_attempt_at=leased_until)
+        return tasks
+
+    # в SQLite блокировок строк нет, а транзакция, начатая с чтения, не получит блокировку на запись.
+    # Поэтому задачи читаем без транзакции и занимаем каждую условным UPDATE
+    tasks = []
+    for task in pending_tasks[:batch_size]:
+        is_claimed = GeocodingTask.objects.filter(
+            id=task.id, status=GEOCODING_PENDING, next_attempt_at=task.next_attempt_at,
+        ).update(next_attempt_at=leased_until)
+        if is_claimed:
+            tasks.append(task)
+    return tasks
+
+
+def geocode_pending_orders(batch_size, max_attempts):
+    # запросы к геокодеру идут без открытой транзакции: база не ждёт сеть
+    tasks = claim_geocoding_tasks(batch_size)
+
+    addresses = {normalize_address(task.order.address): task.order.address for task in tasks}
+    cached_coordinates = get_cached_coordinates_bulk(addresses.values())
+    coordinates_by_address = {address: cached.coordinates for address, cached in cached_coordinates.items()}
+    fetched_coordinates = {}
+    errors_by_address = {}
+    circuit_error = None
+    for address, raw_address in addresses.items():
+        if address in coordinates_by_address:
+            continue
+        try:
+            fetched_coordinates[address] = coordinates_by_address[address] = fetch_coordinates(raw_address)
+        except CircuitOpen as error:
+            # предохранитель не пускает запросы: остальные адреса не пробуем, а попытки не тратим
+            circuit_error = error
+            break
+        except requests.RequestException as error:
+            errors_by_address[address] = error
+
+    now = timezone.now()
+    geocoded_orders = []
+    failed_count = 0
+    for task in tasks:
+        address = normalize_address(task.order.address)
+        if address not in coordinates_by_address and address not in errors_by_address:
+            failed_count += 1
+            task.error = str(circuit_error)
+            task.next_attempt_at = now + timedelta(seconds=circuit_error.retry_after)
+            continue
+
+        task.attempts += 1
+        task.processed_at = now
+        if address in errors_by_address:
+            failed_count += 1
+            task.error = str(errors_by_address[address])
+            task.next_attempt_at = now + get_geocoding_retry_delay(task.attempts)
+            if task.attempts >= max_attempts:
+                task.status = GEOCODING_FAILED
+            continue
+
+        task.status = GEOCODING_DONE
+        task.error = ''
+        coordinates = coordinates_by_address[address]
+        if coordinates:
+            task.order.longitude, task.order.latitude = coordinates
+            task.order.updated_at = now
+            geocoded_orders.append(task.order)
+
+    with transaction.atomic():
+        if fetched_coordinates:
+            save_cached_coordinates_bulk(fetched_coordinates)
+        Order.objects.bulk_update(geocoded_orders, ['latitude', 'longitude', 'updated_at'])
+        GeocodingTask.objects.bulk_update(tasks, ['status', 'attempts', 'processed_at', 'next_attempt_at', 'error'])
+    if geocoded_orders:
+        # bulk_update не отправляет сигналы, расстояния до ресторанов обновляем сами
+        candidates.refresh_candidates(order_ids=[order.id for order in geocoded_orders], touch_orders=True)
+    return len(tasks), failed_count
+
+
+def evict_geocode_cache():
+    expired_before = timezone.now() - timedelta(
+        seconds=max(settings.GEOCODE_CACHE_TTL, settings.GEOCODE_CACHE_NOT_FOUND_TTL)
+    )
+    GeocodeCache.objects.filter(fetched_at__lt=expired_before).delete()
+
+    overflow = (
+        GeocodeCache.objects
+        .order_by('-fetched_at')
+        .values_list('pk', flat=True)[settings.GEOCODE_CACHE_MAX_ENTRIES:]
+    )
+    overflow_ids = list(overflow)
+    if overflow_ids:
+        GeocodeCache.objects.filter(pk__in=overflow_ids).delete()
+
+
+def calculate_distance_matrix(origins, destinations):
     earth_radius_in_km = 6371
 
-    lat1 = radians(float(lat1))
-    lon1 = radians(float(lon1))
-    lat2 = radians(float(lat2))
-    lon2 = radians(float(lon2))
+    origins = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    lat1, lon1 = origins[:, 0, np.newaxis], origins[:, 1, np.newaxis]
+    lat2, lon2 = destinations[np.newaxis, :, 0], destinations[np.newaxis, :, 1]
     dlat = lat2 - lat1
     dlon = lon2 - lon1
 
-    sin_half_dist_sqr = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    central_angle = 2 * atan2(sqrt(sin_half_dist_sqr), sqrt(1 - sin_half_dist_sqr))
+    sin_half_dist_sqr = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    central_angle = 2 * np.arctan2(np.sqrt(sin_half_dist_sqr), np.sqrt(1 - sin_half_dist_sqr))
 
     return earth_radius_in_km * central_angle
+
+
+def sort_by_distance(origins, destinations):
+    distances = calculate_distance_matrix(origins, destinations)
+    return distances, np.argsort(distances, axis=1)
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    return float(calculate_distance_matrix([(lat1, lon1)], [(lat2, lon2)])[0, 0])
+
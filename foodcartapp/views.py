@@ -1,37 +1,65 @@
-from django.http import JsonResponse
-from django.templatetags.static import static
+import hashlib
+import json
+
+import requests
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.http import HttpResponseNotAllowed, HttpResponseNotModified
+from django.db.models import Min, Q
+from django.utils.cache import patch_cache_control
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import generics, status
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 
-from .models import Product, Order
+from star_burger.db_router import read_from_replica
+
+from .cache import BANNERS_NAMESPACE, CATALOG_NAMESPACE, bump_version, get_or_set_versioned
+from .geocoder import get_geocoder
+from .models import Banner, Product, Order
+from .renderers import FastJSONRenderer, FastJSONResponse, dumps
 from .serializers import OrderSerializer
+from .utils import save_cached_coordinates
 
 
-def banners_list_api(request):
-    # FIXME move data to db?
-    return JsonResponse([
-        {
-            'title': 'Burger',
-            'src': static('burger.jpg'),
-            'text': 'Tasty Burger at your door step',
-        },
-        {
-            'title': 'Spices',
-            'src': static('food.jpg'),
-            'text': 'All Cuisines',
-        },
+def get_banners_content():
+    banners = get_or_set_versioned(BANNERS_NAMESPACE, ['content'], build_banners)
+    if banners['expires_at'] and banners['expires_at'] <= timezone.now():
+        # начался или закончился показ одного из баннеров
+        bump_version(BANNERS_NAMESPACE)
+        banners = get_or_set_versioned(BANNERS_NAMESPACE, ['content'], build_banners)
+    return banners['content']
+
+
+def build_banners():
+    now = timezone.now()
+    content = dumps([
         {
-            'title': 'New York',
-            'src': static('tasty.jpg'),
-            'text': 'Food is incomplete without a tasty dessert',
+            'title': banner.title,
+            'src': banner.image.url,
+            'text': banner.text,
         }
-    ], safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+        for banner in Banner.objects.active(now)
+    ])
+    next_changes = Banner.objects.aggregate(
+        next_start=Min('active_from', filter=Q(active_from__gt=now)),
+        next_end=Min('active_until', filter=Q(active_until__gt=now)),
+    )
+    changes = [change for change in next_changes.values() if change]
+    return {
+        'content': content,
+        'expires_at': min(changes) if changes else None,
+    }
 
 
-def product_list_api(request):
+@read_from_replica
+def banners_list_api(request):
+    return FastJSONResponse(content=get_banners_content())
+
+
+def dump_products():
     products = Product.objects.select_related('category').available()
 
     dumped_products = []
@@ -53,15 +81,39 @@ def product_list_api(request):
             }
         }
         dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    return dumped_products
+
+
+def get_catalog():
+    return get_or_set_versioned(CATALOG_NAMESPACE, ['products'], build_catalog, settings.CATALOG_CACHE_TIMEOUT)
+
+
+def build_catalog():
+    content = dumps(dump_products())
+    return {
+        'content': content,
+        'etag': quote_etag(hashlib.sha256(content).hexdigest()),
+    }
+
+
+@read_from_replica
+def product_list_api(request):
+    catalog = get_catalog()
+
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if catalog['etag'] in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        response = FastJSONResponse(content=catalog['content'])
+    response['ETag'] = catalog['etag']
+    patch_cache_control(response, no_cache=True)
+    return response
 
 
 class OrderCreateView(generics.CreateAPIView):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     def create(self, request, *args, **kwargs):
         if not request.data.get('products'):
@@ -74,3 +126,42 @@ class OrderCreateView(generics.CreateAPIView):
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data)
+
+
+async def order_create_async(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    try:
+        order_data = json.loads(request.body)
+    except ValueError:
+        return FastJSONResponse({'detail': 'Некорректный JSON'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not isinstance(order_data, dict) or not order_data.get('products'):
+        return FastJSONResponse(
+            {'products': ['Не указаны продукты в заказе!']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    serializer = OrderSerializer(data=order_data)
+    if not await sync_to_async(serializer.is_valid)():
+        return FastJSONResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    address = serializer.validated_data['address']
+    save_kwargs = {}
+    if not serializer.validated_data['cached_coordinates']:
+        try:
+            coordinates = await get_geocoder().afetch_coordinates(address)
+        except requests.RequestException:
+            # заказ всё равно примем, координаты найдёт фоновый обработчик
+            pass
+        else:
+            await sync_to_async(save_cached_coordinates)(address, coordinates)
+            save_kwargs['coordinates'] = coordinates
+
+    await sync_to_async(serializer.save)(**save_kwargs)
+    return FastJSONResponse(await sync_to_async(lambda: serializer.data)())
+
+
+# csrf_exempt в Django 3.2 не умеет оборачивать асинхронные view
+order_create_async.csrf_exempt = True
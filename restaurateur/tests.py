@@ -1,3 +1,207 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from foodcartapp.candidates import refresh_candidates
+from foodcartapp.datagen import generate_dataset
+from foodcartapp.models import COMPLETED, Order, OrderRestaurantCandidate, Product
+from restaurateur.views import format_updates_cursor, format_updates_version
+from star_burger.db_router import ReplicaRouter, read_from_primary, read_from_replica, use_replica
+from star_burger.middleware import replica_stickiness_middleware
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+router = ReplicaRouter()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ManagerViewsQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = generate_dataset()
+        cls.manager = get_user_model().objects.create_superuser('manager', 'manager@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def test_orders(self):
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('restaurateur:view_orders'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_products(self):
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('restaurateur:ProductsView'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_products_warm_cache(self):
+        self.client.get(reverse('restaurateur:ProductsView'))
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('restaurateur:ProductsView'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_restaurants(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('restaurateur:RestaurantView'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_completed_orders_show_restaurants(self):
+        eligible_order_ids = set(
+            OrderRestaurantCandidate.objects
+            .filter(can_prepare=True, distance__isnull=False)
+            .values_list('order', flat=True)
+            .distinct()[:10]
+        )
+        Order.objects.filter(id__in=eligible_order_ids).update(status=COMPLETED)
+
+        response = self.client.get(reverse('restaurateur:view_orders'), {'status': COMPLETED})
+        orders_with_restaurants = response.context['orders_with_restaurants']
+        self.assertEqual({order.id for order, _ in orders_with_restaurants}, eligible_order_ids)
+        for order, restaurants in orders_with_restaurants:
+            self.assertTrue(restaurants)
+            distances = [restaurant['distance'] for restaurant in restaurants]
+            self.assertEqual(distances, sorted(distances))
+
+    def test_metrics_are_not_public(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 403)
+
+    def test_metrics_for_manager(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_order_admin_change_form(self):
+        order = self.dataset.orders[0]
+        with self.assertNumQueries(17):
+            response = self.client.get(reverse('admin:foodcartapp_order_change', args=[order.id]))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ORDER_UPDATES_LONG_POLL=False, ORDER_UPDATES_OVERLAP=10)
+class OrderUpdatesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = generate_dataset(orders_count=20)
+        cls.manager = get_user_model().objects.create_superuser('manager', 'manager@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.manager)
+
+    def get_updates(self, since, latest=''):
+        response = self.client.get(reverse('restaurateur:order_updates'), {'since': since, 'latest': latest})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_short_poll_answers_without_changes(self):
+        now = timezone.now() + timedelta(minutes=1)
+        updates = self.get_updates(since=format_updates_cursor(now, 0), latest=format_updates_version(now))
+        self.assertEqual(updates['orders'], [])
+
+    def test_late_commit_is_not_skipped(self):
+        Order.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+        updates = self.get_updates(since=format_updates_cursor(timezone.now() - timedelta(seconds=10), 0))
+        self.assertEqual(updates['orders'], [])
+
+        # заказ получил метку раньше, чем был отдан предыдущий ответ, а закоммичен после него
+        order = self.dataset.orders[0]
+        Order.objects.filter(id=order.id).update(updated_at=timezone.now() - timedelta(seconds=5))
+        updates = self.get_updates(since=updates['cursor'], latest=updates['latest'])
+        self.assertEqual([update['id'] for update in updates['orders']], [order.id])
+
+    @override_settings(ORDERS_PAGE_SIZE=5)
+    def test_orders_with_same_timestamp_are_paged(self):
+        Order.objects.update(updated_at=timezone.now())
+        received_ids = []
+        updates = {'cursor': format_updates_cursor(timezone.now() - timedelta(minutes=1), 0), 'latest': ''}
+        for _ in range(4):
+            updates = self.get_updates(since=updates['cursor'], latest=updates['latest'])
+            received_ids.extend(update['id'] for update in updates['orders'])
+        self.assertEqual(received_ids, sorted(order.id for order in self.dataset.orders))
+
+    def test_manager_is_checked_on_primary(self):
+        # внутри транзакции TestCase роутер и так читает из основной базы, поэтому смотрим на сам флаг
+        def is_manager(user):
+            replica_flags.append(use_replica.get())
+            return True
+
+        replica_flags = []
+        with mock.patch('restaurateur.views.is_manager', side_effect=is_manager):
+            self.get_updates(since='')
+        self.assertEqual(replica_flags, [False])
+
+    def test_candidates_refresh_resends_order(self):
+        order = self.dataset.orders[0]
+        stamped_at = timezone.now() - timedelta(minutes=1)
+        Order.objects.filter(id=order.id).update(updated_at=stamped_at)
+        refresh_candidates(order_ids=[order.id], touch_orders=True)
+        order.refresh_from_db()
+        self.assertGreater(order.updated_at, stamped_at)
+
+    def test_restaurant_refresh_keeps_orders_timestamps(self):
+        stamped_at = timezone.now() - timedelta(minutes=1)
+        Order.objects.update(updated_at=stamped_at)
+        refresh_candidates()
+        self.assertFalse(Order.objects.exclude(updated_at=stamped_at).exists())
+
+
+@read_from_replica
+def read_view(request):
+    return HttpResponse(router.db_for_read(Product))
+
+
+@read_from_replica
+async def async_read_view(request):
+    return HttpResponse(router.db_for_read(Product))
+
+
+def write_view(request):
+    return HttpResponse(router.db_for_write(Order))
+
+
+class ReplicaRoutingTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_reads_outside_views_go_to_primary(self):
+        self.assertEqual(router.db_for_read(Product), 'default')
+
+    def test_read_view_uses_replica(self):
+        self.assertEqual(read_view(self.factory.get('/')).content, b'replica')
+
+    async def test_async_read_view_uses_replica(self):
+        response = await async_read_view(self.factory.get('/'))
+        self.assertEqual(response.content, b'replica')
+
+    def test_unsafe_method_uses_primary(self):
+        self.assertEqual(read_view(self.factory.post('/')).content, b'default')
+
+    def test_sticky_session_uses_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES['read_primary'] = '1'
+        self.assertEqual(read_view(request).content, b'default')
+
+    def test_read_from_primary_inside_read_view(self):
+        @read_from_replica
+        def view(request):
+            with read_from_primary():
+                return HttpResponse(router.db_for_read(Product))
+
+        self.assertEqual(view(self.factory.get('/')).content, b'default')
+
+    def test_writes_go_to_primary(self):
+        self.assertEqual(router.db_for_write(Order), 'default')
+
+    def test_write_makes_session_sticky(self):
+        response = replica_stickiness_middleware(write_view)(self.factory.post('/'))
+        self.assertIn('read_primary', response.cookies)
+
+    def test_read_does_not_make_session_sticky(self):
+        response = replica_stickiness_middleware(read_view)(self.factory.get('/'))
+        self.assertNotIn('read_primary', response.cookies)
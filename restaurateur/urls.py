@@ -14,6 +14,8 @@ urlpatterns = [
 
     # TODO заглушка для нереализованного функционала
     path('orders/', views.view_orders, name="view_orders"),
+    path('orders/updates/', views.view_order_updates, name="order_updates"),
+    path('cache/stats/', views.view_cache_stats, name="cache_stats"),
 
     path('login/', views.LoginView.as_view(), name="login"),
     path('logout/', views.LogoutView.as_view(), name="logout"),
@@ -1,13 +1,29 @@
+import asyncio
+import os
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from django import forms
+from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import user_passes_test
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views import View
 
-from foodcartapp.models import Product, Restaurant, Order
-from foodcartapp.utils import calculate_distance, get_eligible_restaurants
+from foodcartapp.cache import cache_stats
+from foodcartapp.candidates import attach_calculated_candidates
+from foodcartapp.models import GeocodingTask, Order, OrderRestaurantCandidate, Product, ProductCategory, Restaurant
+from foodcartapp.models import GEOCODING_PENDING, UNPROCESSED_STATUSES
+from foodcartapp.utils import get_menu_availability, get_restaurants, unpack_availability
+from star_burger.db_router import read_from_replica
 
 class Login(forms.Form):
     username = forms.CharField(
@@ -26,6 +42,20 @@ class Login(forms.Form):
     )
 
 
+class OrderFilterForm(forms.Form):
+    status = forms.MultipleChoiceField(
+        label='Статус', required=False,
+        choices=Order.ORDER_STATUS_CHOICES,
+        widget=forms.SelectMultiple(attrs={'class': 'form-control'})
+    )
+    restaurant = forms.ModelChoiceField(
+        label='Ресторан', required=False,
+        queryset=Restaurant.objects.order_by('name'),
+        empty_label='Все рестораны',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+
+
 class LoginView(View):
     def get(self, request, *args, **kwargs):
         form = Login()
@@ -60,63 +90,260 @@ def is_manager(user):
     return user.is_staff  # FIXME replace with specific permission
 
 
+def is_geocoding_pending(order):
+    try:
+        return order.geocoding_task.status == GEOCODING_PENDING
+    except GeocodingTask.DoesNotExist:
+        return False
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
+@read_from_replica
 def view_products(request):
-    restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
+    availability = get_menu_availability()
+    restaurants = availability['restaurants']
+
+    categories = list(ProductCategory.objects.order_by('name'))
+    selected_category = request.GET.get('category')
+    if selected_category is None and categories:
+        selected_category = str(categories[0].id)
 
-    products_with_restaurant_availability = []
-    for product in products:
-        availability = {item.restaurant_id: item.availability for item in product.menu_items.all()}
-        ordered_availability = [availability.get(restaurant.id, False) for restaurant in restaurants]
+    products = Product.objects.select_related('category').order_by('name')
+    if selected_category and selected_category.isdigit():
+        products = products.filter(category_id=selected_category)
+    else:
+        products = products.filter(category__isnull=True)
 
-        products_with_restaurant_availability.append(
-            (product, ordered_availability)
-        )
+    products_with_restaurant_availability = [
+        (product, unpack_availability(availability['masks'].get(product.id, 0), len(restaurants)))
+        for product in products
+    ]
 
     return render(request, template_name="products_list.html", context={
         'products_with_restaurant_availability': products_with_restaurant_availability,
-        'restaurants': restaurants,
+        'restaurants': [{'id': restaurant_id, 'name': name} for restaurant_id, name in restaurants],
+        'categories': categories,
+        'selected_category': selected_category,
     })
 
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
+@read_from_replica
 def view_restaurants(request):
     return render(request, template_name="restaurants_list.html", context={
-        'restaurants': Restaurant.objects.all(),
+        'restaurants': get_restaurants(),
     })
 
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
+def view_cache_stats(request):
+    namespaces = cache_stats.snapshot()
+    for stats in namespaces.values():
+        requests_count = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / requests_count, 3) if requests_count else None
+    return JsonResponse({
+        'backend': settings.CACHES['default']['BACKEND'],
+        # счётчики свои у каждого процесса
+        'pid': os.getpid(),
+        'namespaces': namespaces,
+    })
+
+
+def format_orders_cursor(order):
+    return f'{order.order_date.isoformat()}_{order.id}'
+
+
+def parse_orders_cursor(cursor):
+    order_date, _, order_id = (cursor or '').rpartition('_')
+    try:
+        order_date = parse_datetime(order_date)
+        order_id = int(order_id)
+    except ValueError:
+        return None
+    if not order_date:
+        return None
+    return order_date, order_id
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+@read_from_replica
 def view_orders(request):
-    orders = Order.objects.all()
-    orders_with_restaurants = []
+    filter_form = OrderFilterForm(request.GET)
+    filter_form.is_valid()
+    filters = filter_form.cleaned_data
+
+    orders = Order.objects.filter(status__in=filters.get('status') or UNPROCESSED_STATUSES)
+    if filters.get('restaurant'):
+        orders = orders.filter(assigned_restaurant=filters['restaurant'])
+
+    cursor = parse_orders_cursor(request.GET.get('after'))
+    if cursor:
+        order_date, order_id = cursor
+        orders = orders.filter(Q(order_date__lt=order_date) | Q(order_date=order_date, id__lt=order_id))
+
+    page_size = settings.ORDERS_PAGE_SIZE
+    orders = list(
+        orders
+        .select_related('geocoding_task', 'assigned_restaurant')
+        .order_by('-order_date', '-id')[:page_size + 1]
+    )
+    next_page_url = None
+    if len(orders) > page_size:
+        orders = orders[:page_size]
+        params = request.GET.copy()
+        params['after'] = format_orders_cursor(orders[-1])
+        next_page_url = f'?{params.urlencode()}'
+
+    return render(
+        request,
+        template_name='order_items.html',
+        context={
+            'orders_with_restaurants': get_orders_with_restaurants(orders),
+            'filter_form': filter_form,
+            'next_page_url': next_page_url,
+            **get_order_updates_options(),
+        }
+    )
+
+
+def get_orders_with_restaurants(orders):
+    unprocessed_orders = [order for order in orders if order.status in UNPROCESSED_STATUSES]
+    prefetch_related_objects(unprocessed_orders, Prefetch(
+        'restaurant_candidates',
+        queryset=(
+            OrderRestaurantCandidate.objects
+            .filter(can_prepare=True, distance__isnull=False)
+            .select_related('restaurant')
+            .order_by('distance')
+        ),
+        to_attr='eligible_candidates',
+    ))
+    attach_calculated_candidates([order for order in orders if order.status not in UNPROCESSED_STATUSES])
 
+    orders_with_restaurants = []
     for order in orders:
         order_coordinates = (order.latitude, order.longitude)
 
+        if order_coordinates == (None, None) and is_geocoding_pending(order):
+            orders_with_restaurants.append((order, "Идёт определение координат"))
+            continue
+
         if order_coordinates == (None, None):
             orders_with_restaurants.append((order, "Координаты заказа отсутствуют"))
             continue
 
-        eligible_restaurants = get_eligible_restaurants(order)
-        restaurant_distances = []
-        for restaurant in eligible_restaurants:
-            if restaurant.latitude is None or restaurant.longitude is None:
-                continue
+        restaurant_distances = [
+            {
+                'restaurant': candidate.restaurant,
+                'distance': candidate.distance,
+            }
+            for candidate in order.eligible_candidates[:settings.NEAREST_RESTAURANTS_LIMIT]
+        ]
 
-            distance = calculate_distance(order.latitude, order.longitude, restaurant.latitude, restaurant.longitude)
-            restaurant_distances.append({
-                'restaurant': restaurant,
-                'distance': distance,
-            })
+        orders_with_restaurants.append((order, restaurant_distances))
 
-        restaurant_distances.sort(key=lambda x: x['distance'])
+    return orders_with_restaurants
 
-        orders_with_restaurants.append((order, restaurant_distances))
 
-    return render(
-        request,
-        template_name='order_items.html',
-        context={'orders_with_restaurants': orders_with_restaurants}
+def format_updates_version(moment):
+    # одинаковый формат позволяет странице сравнивать версии заказов как строки
+    return moment.astimezone(timezone.utc).isoformat(timespec='microseconds')
+
+
+def format_updates_cursor(updated_at, order_id):
+    return f'{format_updates_version(updated_at)}_{order_id}'
+
+
+def get_overlap_cursor(started_at):
+    # updated_at ставится до коммита, и транзакция, закоммиченная позже соседней, может нести
+    # более раннюю метку. Поэтому последние ORDER_UPDATES_OVERLAP секунд перечитываются,
+    # а повторы страница отбрасывает по updated_at
+    return started_at - timedelta(seconds=settings.ORDER_UPDATES_OVERLAP), 0
+
+
+def parse_updates_version(version):
+    try:
+        return parse_datetime(version or '')
+    except ValueError:
+        return None
+
+
+def get_order_updates_options():
+    now = timezone.now()
+    return {
+        'updates_cursor': format_updates_cursor(*get_overlap_cursor(now)),
+        'updates_latest': format_updates_version(now),
+        'updates_long_poll': settings.ORDER_UPDATES_LONG_POLL,
+        'updates_refresh_interval_ms': int(settings.ORDER_UPDATES_REFRESH_INTERVAL * 1000),
+    }
+
+
+def get_updated_orders(cursor):
+    orders = Order.objects.all()
+    if cursor:
+        updated_at, order_id = cursor
+        orders = orders.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=order_id))
+    return list(
+        orders
+        .select_related('geocoding_task', 'assigned_restaurant')
+        .order_by('updated_at', 'id')[:settings.ORDERS_PAGE_SIZE]
     )
+
+
+def get_next_updates_cursor(orders, started_at):
+    # полная страница значит, что за ней есть ещё заказы: продолжаем сразу после неё,
+    # иначе страница заказов с одинаковой меткой повторялась бы бесконечно
+    if len(orders) == settings.ORDERS_PAGE_SIZE:
+        return orders[-1].updated_at, orders[-1].id
+    return get_overlap_cursor(started_at)
+
+
+def render_order_updates(request, orders, cursor, latest):
+    filter_form = OrderFilterForm(request.GET)
+    filter_form.is_valid()
+    filters = filter_form.cleaned_data
+    statuses = filters.get('status') or UNPROCESSED_STATUSES
+    if orders and (not latest or orders[-1].updated_at > latest):
+        latest = orders[-1].updated_at
+
+    return {
+        'cursor': format_updates_cursor(*cursor),
+        'latest': format_updates_version(latest) if latest else '',
+        'orders': [
+            {
+                'id': order.id,
+                'updated_at': format_updates_version(order.updated_at),
+                # заказ, который перестал подходить под фильтр, убирается со страницы
+                'visible': order.status in statuses and (
+                    not filters.get('restaurant') or order.assigned_restaurant == filters['restaurant']
+                ),
+                'html': render_to_string('order_row.html', {'order': order, 'info': info}, request=request),
+            }
+            for order, info in get_orders_with_restaurants(orders)
+        ],
+    }
+
+
+async def view_order_updates(request):
+    # сессию и пользователя проверяем по основной базе, как user_passes_test в остальных view
+    if not await sync_to_async(is_manager)(request.user):
+        return JsonResponse({'detail': 'Доступно только менеджерам'}, status=403)
+    return await poll_order_updates(request)
+
+
+@read_from_replica
+async def poll_order_updates(request):
+    since = parse_orders_cursor(request.GET.get('since'))
+    latest = parse_updates_version(request.GET.get('latest'))
+    deadline = time.monotonic() + settings.ORDER_UPDATES_TIMEOUT
+    while True:
+        started_at = timezone.now()
+        # запрос идёт по индексу на updated_at, поэтому опрашивать базу дёшево
+        orders = await sync_to_async(get_updated_orders)(since)
+        # без длинного опроса отвечаем сразу, а страница повторит запрос через ORDER_UPDATES_REFRESH_INTERVAL.
+        # При длинном опросе ждём заказов новее уже показанных, а перечитанные отдаём по таймауту
+        has_news = not latest or any(order.updated_at > latest for order in orders)
+        if not settings.ORDER_UPDATES_LONG_POLL or has_news or time.monotonic() >= deadline:
+            cursor = get_next_updates_cursor(orders, started_at)
+            return JsonResponse(await sync_to_async(render_order_updates)(request, orders, cursor, latest))
+        await asyncio.sleep(settings.ORDER_UPDATES_POLL_INTERVAL)
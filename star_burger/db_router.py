@@ -0,0 +1,77 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA_DB_ALIAS = 'replica'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+use_replica = ContextVar('use_replica', default=False)
+request_writes = ContextVar('request_writes', default=None)
+
+
+class RequestWrites:
+    def __init__(self):
+        self.happened = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # внутри транзакции читаем оттуда же, куда пишем
+        if use_replica.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        writes = request_writes.get()
+        if writes is not None:
+            writes.happened = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # на реплике те же данные, что в основной базе
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def is_sticky(request):
+    return settings.REPLICA_STICKY_COOKIE in request.COOKIES
+
+
+def read_from_replica(view):
+    # после записи сессия какое-то время читает из основной базы, чтобы видеть свои изменения
+    def should_use_replica(request):
+        return request.method in SAFE_METHODS and not is_sticky(request)
+
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            token = use_replica.set(should_use_replica(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                use_replica.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = use_replica.set(should_use_replica(request))
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                use_replica.reset(token)
+    return wrapper
+
+
+@contextmanager
+def read_from_primary():
+    token = use_replica.set(False)
+    try:
+        yield
+    finally:
+        use_replica.reset(token)
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+from foodcartapp.cache import request_cache_stats
+from foodcartapp.geocoder import geocoder_metrics, get_circuit_breaker
+
+from .db_router import RequestWrites, request_writes
+
+
+logger = logging.getLogger('star_burger.metrics')
+
+DURATION_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+request_queries = ContextVar('request_queries', default=None)
+
+
+class RequestQueries:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, duration):
+        # запросы асинхронной view выполняются в других потоках
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+
+
+def record_query(execute, sql, params, many, context):
+    queries = request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.add(time.perf_counter() - started_at)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.durations = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))
+        self.durations_sum = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, view, method, status, duration, queries_count, queries_duration,
+                cache_stats, over_budget):
+        labels = (view, method, status)
+        with self._lock:
+            self.counters['requests_total', labels] += 1
+            self.counters['db_queries_total', labels] += queries_count
+            self.counters['db_query_duration_seconds_total', labels] += queries_duration
+            self.counters['cache_hits_total', labels] += cache_stats['hits']
+            self.counters['cache_misses_total', labels] += cache_stats['misses']
+            if over_budget:
+                self.counters['query_budget_exceeded_total', labels] += 1
+            self.durations_sum[labels] += duration
+            buckets = self.durations[labels]
+            for position, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[position] += 1
+                    break
+            else:
+                buckets[-1] += 1
+
+    def render(self):
+        with self._lock:
+            counters = dict(self.counters)
+            durations = {labels: list(buckets) for labels, buckets in self.durations.items()}
+            durations_sum = dict(self.durations_sum)
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f'# TYPE star_burger_{name} counter')
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    lines.append(f'star_burger_{name}{{{format_labels(labels)}}} {value:g}')
+
+        lines.append('# TYPE star_burger_request_duration_seconds histogram')
+        for labels, buckets in sorted(durations.items()):
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS + ['+Inf'], buckets):
+                cumulative += count
+                lines.append(
+                    f'star_burger_request_duration_seconds_bucket{{{format_labels(labels)},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'star_burger_request_duration_seconds_sum{{{format_labels(labels)}}} {durations_sum[labels]:g}')
+            lines.append(f'star_burger_request_duration_seconds_count{{{format_labels(labels)}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    view, method, status = labels
+    view = view.replace('\\', '\\\\').replace('"', '\\"')
+    return f'view="{view}",method="{method}",status="{status}"'
+
+
+metrics_registry = MetricsRegistry()
+
+
+def render_geocoder_metrics():
+    # запросы к геокодеру из этого процесса: и асинхронный приём заказов, и фоновые команды
+    metrics = geocoder_metrics.snapshot()
+    return '\n'.join([
+        '# TYPE star_burger_geocoder_requests_total counter',
+        f'star_burger_geocoder_requests_total {metrics["requests"]}',
+        '# TYPE star_burger_geocoder_failures_total counter',
+        f'star_burger_geocoder_failures_total {metrics["failures"]}',
+        '# TYPE star_burger_geocoder_rejected_total counter',
+        f'star_burger_geocoder_rejected_total {metrics["rejected"]}',
+        '# TYPE star_burger_geocoder_latency_seconds_total counter',
+        f'star_burger_geocoder_latency_seconds_total {metrics["latency_total"]:g}',
+        '# TYPE star_burger_geocoder_latency_max_seconds gauge',
+        f'star_burger_geocoder_latency_max_seconds {metrics["latency_max"]:g}',
+        '# TYPE star_burger_geocoder_circuit_open gauge',
+        f'star_burger_geocoder_circuit_open {int(get_circuit_breaker().is_open)}',
+    ]) + '\n'
+
+
+def start_request():
+    # соединения, открытые до подключения middleware, тоже должны считать запросы
+    for connection in connections.all():
+        if record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(record_query)
+    queries = RequestQueries()
+    cache_stats = Counter(hits=0, misses=0)
+    return (
+        time.perf_counter(),
+        queries,
+        cache_stats,
+        request_queries.set(queries),
+        request_cache_stats.set(cache_stats),
+    )
+
+
+def finish_request(request, response, started_at, queries, cache_stats, queries_token, cache_token):
+    duration = time.perf_counter() - started_at
+    request_queries.reset(queries_token)
+    request_cache_stats.reset(cache_token)
+
+    resolver_match = getattr(request, 'resolver_match', None)
+    view = resolver_match.view_name if resolver_match else 'unresolved'
+    budget = settings.QUERY_BUDGETS.get(view)
+    over_budget = budget is not None and queries.count > budget
+
+    metrics_registry.observe(
+        view, request.method, response.status_code, duration,
+        queries.count, queries.duration, cache_stats, over_budget,
+    )
+
+    record = {
+        'view': view,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 1),
+        'db_queries': queries.count,
+        'db_time_ms': round(queries.duration * 1000, 1),
+        'cache_hits': cache_stats['hits'],
+        'cache_misses': cache_stats['misses'],
+    }
+    if over_budget:
+        record['query_budget'] = budget
+        logger.warning(json.dumps(record, ensure_ascii=False))
+    else:
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+
+def request_metrics_middleware(get_response):
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            state = start_request()
+            response = await get_response(request)
+            finish_request(request, response, *state)
+            return response
+    else:
+        def middleware(request):
+            state = start_request()
+            response = get_response(request)
+            finish_request(request, response, *state)
+            return response
+    return middleware
+
+
+request_metrics_middleware.sync_capable = True
+request_metrics_middleware.async_capable = True
+
+
+def metrics_view(request):
+    is_allowed_address = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not (is_allowed_address or request.user.is_staff):
+        return HttpResponseForbidden()
+    content = metrics_registry.render() + render_geocoder_metrics()
+    return HttpResponse(content, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def replica_stickiness_middleware(get_response):
+    # после записи ставим куку, и следующие запросы сессии читают из основной базы,
+    # пока реплика не догонит её изменения
+    def finish(response, writes, token):
+        request_writes.reset(token)
+        if writes.happened:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            writes = RequestWrites()
+            token = request_writes.set(writes)
+            return finish(await get_response(request), writes, token)
+    else:
+        def middleware(request):
+            writes = RequestWrites()
+            token = request_writes.set(writes)
+            return finish(get_response(request), writes, token)
+    return middleware
+
+
+replica_stickiness_middleware.sync_capable = True
+replica_stickiness_middleware.async_capable = True
@@ -9,6 +9,34 @@ env = Env()
 env.read_env()
 
 YANDEX_API_KEY = env('YANDEX_API_KEY')
+GEOCODER_BACKEND = env.str('GEOCODER_BACKEND', 'foodcartapp.geocoder.YandexGeocoder')
+GEOCODER_FALLBACK_BACKEND = env.str('GEOCODER_FALLBACK_BACKEND', '')
+GEOCODER_GAZETTEER_PATH = env.str('GEOCODER_GAZETTEER_PATH', '')
+YANDEX_GEOCODER_URL = env.str('YANDEX_GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+GEOCODER_CONNECT_TIMEOUT = env.float('GEOCODER_CONNECT_TIMEOUT', 3)
+GEOCODER_READ_TIMEOUT = env.float('GEOCODER_READ_TIMEOUT', 5)
+GEOCODER_POOL_SIZE = env.int('GEOCODER_POOL_SIZE', 100)
+GEOCODER_RETRIES = env.int('GEOCODER_RETRIES', 2)
+GEOCODER_RETRY_BACKOFF = env.float('GEOCODER_RETRY_BACKOFF', 0.5)
+GEOCODER_CIRCUIT_FAILURES = env.int('GEOCODER_CIRCUIT_FAILURES', 5)
+GEOCODER_CIRCUIT_RESET_TIMEOUT = env.float('GEOCODER_CIRCUIT_RESET_TIMEOUT', 30)
+# пауза перед повторной попыткой геокодирования удваивается с каждой неудачей
+GEOCODING_RETRY_DELAY = env.float('GEOCODING_RETRY_DELAY', 30)
+GEOCODING_RETRY_MAX_DELAY = env.float('GEOCODING_RETRY_MAX_DELAY', 60 * 60)
+GEOCODING_LEASE = env.float('GEOCODING_LEASE', 5 * 60)
+GEOCODE_CACHE_TTL = env.int('GEOCODE_CACHE_TTL', 30 * 24 * 60 * 60)
+GEOCODE_CACHE_NOT_FOUND_TTL = env.int('GEOCODE_CACHE_NOT_FOUND_TTL', 24 * 60 * 60)
+GEOCODE_CACHE_MAX_ENTRIES = env.int('GEOCODE_CACHE_MAX_ENTRIES', 10000)
+RESTAURANT_INDEX_CELL_SIZE = env.float('RESTAURANT_INDEX_CELL_SIZE', 0.05)
+NEAREST_RESTAURANTS_LIMIT = env.int('NEAREST_RESTAURANTS_LIMIT', 10)
+ORDERS_PAGE_SIZE = env.int('ORDERS_PAGE_SIZE', 50)
+# длинный опрос держит воркер на всё время ожидания, поэтому включается только под ASGI
+ORDER_UPDATES_LONG_POLL = env.bool('ORDER_UPDATES_LONG_POLL', False)
+ORDER_UPDATES_REFRESH_INTERVAL = env.float('ORDER_UPDATES_REFRESH_INTERVAL', 10)
+ORDER_UPDATES_TIMEOUT = env.float('ORDER_UPDATES_TIMEOUT', 25)
+ORDER_UPDATES_POLL_INTERVAL = env.float('ORDER_UPDATES_POLL_INTERVAL', 1)
+ORDER_UPDATES_OVERLAP = env.float('ORDER_UPDATES_OVERLAP', 10)
+JSON_BACKEND = env.str('JSON_BACKEND', 'orjson')
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = env('SECRET_KEY')
 DEBUG = env.bool('DEBUG', False)
@@ -24,12 +52,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'phonenumber_field',
     'rest_framework',
 ]
 
 MIDDLEWARE = [
+    'star_burger.middleware.request_metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -37,10 +65,52 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'rollbar.contrib.django.middleware.RollbarNotifierMiddlewareExcluding404',
 ]
 
+# debug_toolbar не поддерживает асинхронные view: с ним весь запрос
+# выполняется синхронно, поэтому на проде он не подключается
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.clickjacking.XFrameOptionsMiddleware') + 1,
+        'debug_toolbar.middleware.DebugToolbarMiddleware',
+    )
+
+# сколько SQL-запросов может сделать view, прежде чем в логе появится предупреждение.
+# У restaurateur:order_updates лимита нет: при длинном опросе он проверяет базу раз в
+# ORDER_UPDATES_POLL_INTERVAL, и число запросов зависит от того, сколько пришлось ждать
+QUERY_BUDGETS = {
+    'restaurateur:view_orders': 10,
+    'restaurateur:ProductsView': 10,
+    'restaurateur:RestaurantView': 5,
+    'admin:foodcartapp_order_change': 20,
+    'foodcartapp:order_create': 20,
+    'foodcartapp:order_create_async': 25,
+}
+QUERY_BUDGETS.update({
+    view: int(budget) for view, budget in env.dict('QUERY_BUDGETS', {}).items()
+})
+# за nginx у всех запросов REMOTE_ADDR 127.0.0.1, поэтому по умолчанию страница открыта только менеджерам
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', [])
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'star_burger.metrics': {
+            'handlers': ['console'],
+            'level': env.str('REQUEST_METRICS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 ROLLBAR = {
     'access_token': env.str('ROLLBAR_ACCESS_TOKEN', default=None),
     'environment': env.str('ROLLBAR_ENVIRONMENT', default='development'),
@@ -83,6 +153,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'star_burger.wsgi.application'
+ASGI_APPLICATION = 'star_burger.asgi.application'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
@@ -98,6 +169,33 @@ DATABASES = {
     'default': dj_database_url.config(default=DATABASE_URL, conn_max_age=600)
 }
 
+# страницы менеджера и каталог читают с реплики, если она задана
+REPLICA_DATABASE_URL = env.str('REPLICA_DATABASE_URL', '')
+# столько секунд после записи сессия читает из основной базы
+REPLICA_STICKY_SECONDS = env.int('REPLICA_STICKY_SECONDS', 10)
+REPLICA_STICKY_COOKIE = 'read_primary'
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = dj_database_url.parse(REPLICA_DATABASE_URL, conn_max_age=600)
+    # в тестах реплика смотрит в ту же тестовую базу
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['star_burger.db_router.ReplicaRouter']
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('star_burger.middleware.request_metrics_middleware') + 1,
+        'star_burger.middleware.replica_stickiness_middleware',
+    )
+
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', 'locmem://'),
+}
+if CACHES['default']['BACKEND'] == 'django.core.cache.backends.redis.RedisCache':
+    # своего бэкенда для Redis в Django 3.2 ещё нет
+    CACHES['default']['BACKEND'] = 'django_redis.cache.RedisCache'
+# кэш в памяти у каждого воркера gunicorn свой, и сброс версий после изменений виден
+# только тому воркеру, который их сделал. Остальные отдают устаревшие данные до истечения таймаута
+IS_LOCAL_CACHE = CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache'
+CACHE_TIMEOUT = env.int('CACHE_TIMEOUT', 60 if IS_LOCAL_CACHE else 24 * 60 * 60)
+CATALOG_CACHE_TIMEOUT = env.int('CATALOG_CACHE_TIMEOUT', CACHE_TIMEOUT)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',